@@ -6,6 +6,7 @@ BigQuery CSV 上傳器
 主要功能：
 - 支援單一檔案或批次上傳至 BigQuery
 - 自動重複資料檢查與處理
+- 支援經暫存表以 MERGE 在 BigQuery 端去重寫入
 - 互動式操作介面
 - 完整的日誌記錄與錯誤追蹤
 - 支援多種上傳模式 (WRITE_TRUNCATE/APPEND/EMPTY)
@@ -17,8 +18,8 @@ Studio: tranquility-base
 import argparse
 import os
 import sys
-import pandas as pd
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 
@@ -26,12 +27,8 @@ from pathlib import Path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
 # ✅ 使用相對 import
-from bigquery_utils import get_bq_client, upload_csv_to_bq, check_duplicate_order_sn
-from bq_schemas import (
-    c1105_momo_accounting_orders_schema,
-    a1102_momo_shipping_orders_schema,
-    etmall_orders_schema,
-)
+from bigquery_utils import get_bq_client, get_bq_credentials, read_csv_header, read_csv_as_arrow, upload_arrow_table_to_bq, merge_arrow_table_to_bq, check_duplicate_order_sn_table
+from bq_schemas import MERGE_KEY_REGISTRY, SCHEMA_REGISTRY
 
 # 預設 dataset 與 cleaned 檔案路徑
 DEFAULT_DATASET = "yichai_momo_data"
@@ -89,15 +86,16 @@ def main():
     parser.add_argument("--check_duplicates", action="store_true", default=True, help="檢查 order_sn 重複 (預設開啟)")
     parser.add_argument("--no_check_duplicates", action="store_true", help="跳過重複檢查")
     parser.add_argument("--upload_all", action="store_true", help="一鍵上傳所有預設 cleaned 檔案")
+    parser.add_argument("--staging_bucket", type=str, help="GCS 暫存桶名稱 (指定時先上傳至 GCS 再由 BigQuery 載入)")
+    parser.add_argument("--merge", action="store_true", help="經暫存表以 MERGE 寫入，由 BigQuery 依資料表的去重鍵去重 (order_sn；etmall_orders 為 order_line_uid，忽略 write_disposition 與重複檢查)")
     args = parser.parse_args()
 
     check_duplicates = args.check_duplicates and not args.no_check_duplicates
-    logger.info(f"參數設定：dataset={args.dataset}, write_disposition={args.write_disposition}, check_duplicates={check_duplicates}")
+    logger.info(f"參數設定：dataset={args.dataset}, write_disposition={args.write_disposition}, check_duplicates={check_duplicates}, staging_bucket={args.staging_bucket}, merge={args.merge}")
 
     if args.upload_all:
         logger.info("🚀 開始上傳所有預設 cleaned 檔案...")
-        for table_name, csv_path in DEFAULT_FILES.items():
-            upload_single_file(args.credential, csv_path, args.dataset, table_name, args.write_disposition, check_duplicates, logger)
+        upload_all_files(args.credential, args.dataset, args.write_disposition, check_duplicates, logger, args.staging_bucket, args.merge)
         logger.info("✅ 所有檔案上傳完成！")
         return
 
@@ -113,104 +111,126 @@ def main():
             return
         logger.info(f"📂 使用預設路徑: {csv_path}")
 
-    upload_single_file(args.credential, csv_path, args.dataset, args.table, args.write_disposition, check_duplicates, logger)
+    upload_single_file(args.credential, csv_path, args.dataset, args.table, args.write_disposition, check_duplicates, logger, args.staging_bucket, merge=args.merge)
 
 
-def upload_single_file(credential_path: str, csv_path: str, dataset_id: str, table_id: str, write_disposition: str, check_duplicates: bool = True, logger=None) -> None:
-    """上傳單一 CSV 檔案至 BigQuery"""
+def upload_all_files(credential_path: str, dataset_id: str, write_disposition: str, check_duplicates: bool = True, logger=None, staging_bucket: str = None, merge: bool = False) -> None:
+    """平行上傳所有預設 cleaned 檔案至 BigQuery
+
+    各檔案的載入作業互相獨立，主要時間花在網路傳輸與等待 job.result()，
+    因此以執行緒池同時送出，並共用同一個（執行緒安全的）BigQuery 客戶端。
+    """
+    log = logger or logging.getLogger(__name__)
+    client = get_bq_client(credential_path)
+
+    with ThreadPoolExecutor(max_workers=len(DEFAULT_FILES)) as executor:
+        futures = {
+            executor.submit(upload_single_file, credential_path, csv_path, dataset_id, table_name,
+                            write_disposition, check_duplicates, logger, staging_bucket, client, merge): table_name
+            for table_name, csv_path in DEFAULT_FILES.items()
+        }
+        for future in as_completed(futures):
+            table_name = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                log.error("❌ %s 上傳過程發生錯誤: %s", table_name, e)
+
+
+def upload_single_file(credential_path: str, csv_path: str, dataset_id: str, table_id: str, write_disposition: str, check_duplicates: bool = True, logger=None, staging_bucket: str = None, client=None, merge: bool = False) -> None:
+    """上傳單一 CSV 檔案至 BigQuery（可傳入既有的 client 以重複使用）
+
+    merge 為 True 時不在本機檢查重複，改經暫存表以 MERGE 由 BigQuery 端依 MERGE_KEY_REGISTRY 的去重鍵去重。
+    """
+    log = logger or logging.getLogger(__name__)
     csv_path = csv_path.replace('/', os.sep)
 
     if not os.path.exists(csv_path):
-        error_msg = f"❌ 找不到 CSV: {csv_path}"
-        if logger:
-            logger.error(error_msg)
-        else:
-            print(error_msg)
+        log.error("❌ 找不到 CSV: %s", csv_path)
         return
 
-    schema_dict = {
-        "c1105_momo_accounting_orders": c1105_momo_accounting_orders_schema,
-        "a1102_momo_shipping_orders": a1102_momo_shipping_orders_schema,
-        "etmall_orders": etmall_orders_schema,
-    }
-
-    schema = schema_dict.get(table_id)
+    schema = SCHEMA_REGISTRY.get(table_id)
     if schema is None:
-        error_msg = f"❌ 尚未定義 table schema: {table_id}"
-        if logger:
-            logger.error(error_msg)
-        else:
-            print(error_msg)
+        log.error("❌ 尚未定義 table schema: %s", table_id)
         return
 
-    info_msg = f"📤 準備上傳: {csv_path} -> {dataset_id}.{table_id}"
-    if logger:
-        logger.info(info_msg)
-    else:
-        print(info_msg)
+    log.info("📤 準備上傳: %s -> %s.%s", csv_path, dataset_id, table_id)
 
-    client = get_bq_client(credential_path)
+    # Parquet 依欄位名稱載入，不會像 CSV 載入作業一樣因欄位不符而失敗，上傳前先比對標題列與 schema
+    try:
+        header = read_csv_header(csv_path)
+    except Exception as e:
+        log.error("❌ 讀取 CSV 失敗: %s - %s", csv_path, e)
+        return
+    schema_names = [field.name for field in schema]
+    missing_columns = [name for name in schema_names if name not in header]
+    extra_columns = [name for name in header if name not in schema_names]
+    if missing_columns or extra_columns:
+        if missing_columns:
+            log.error("❌ CSV 缺少 schema 欄位: %s", missing_columns)
+        if extra_columns:
+            log.error("❌ CSV 有 schema 未定義的欄位: %s", extra_columns)
+        log.error("❌ CSV 欄位與 %s 的 schema 不符，略過上傳: %s", table_id, csv_path)
+        return
+
+    if client is None:
+        client = get_bq_client(credential_path)
+
+    # 只讀取一次 CSV：同一份 Arrow 資料表同時供重複檢查與 Parquet 上傳使用
+    try:
+        table = read_csv_as_arrow(csv_path, schema)
+    except Exception as e:
+        log.error("❌ 讀取 CSV 失敗: %s - %s", csv_path, e)
+        return
 
-    df = pd.read_csv(csv_path, dtype=str)
+    if merge:
+        if not merge_arrow_table_to_bq(
+            client,
+            table,
+            dataset_id,
+            table_id,
+            schema,
+            key_column=MERGE_KEY_REGISTRY.get(table_id, "order_sn"),
+            logger=logger,
+            staging_bucket=staging_bucket,
+            credentials=get_bq_credentials(credential_path)
+        ):
+            log.error("❌ %s MERGE 寫入失敗: %s", table_id, csv_path)
+        return
 
     final_write_disposition = write_disposition
     if check_duplicates:
-        check_msg = "🔍 檢查 order_sn 重複..."
-        if logger:
-            logger.info(check_msg)
-        else:
-            print(check_msg)
+        log.info("🔍 檢查 order_sn 重複...")
         
-        duplicates = check_duplicate_order_sn(df)
+        duplicates = check_duplicate_order_sn_table(table)
         if duplicates is not None:
             duplicate_count = len(duplicates)
-            warning_msg = f"⚠️ 發現 {duplicate_count} 筆重複 order_sn"
-            if logger:
-                logger.warning(warning_msg)
-            else:
-                print(warning_msg)
+            log.warning("⚠️ 發現 %s 筆重複 order_sn", duplicate_count)
             
             if write_disposition == "WRITE_APPEND":
                 final_write_disposition = "WRITE_TRUNCATE"
-                switch_msg = "🔄 自動切換為覆蓋模式 (WRITE_TRUNCATE)"
-                if logger:
-                    logger.info(switch_msg)
-                else:
-                    print(switch_msg)
+                log.info("🔄 自動切換為覆蓋模式 (WRITE_TRUNCATE)")
             else:
-                mode_msg = f"💡 維持原設定模式: {write_disposition}"
-                if logger:
-                    logger.info(mode_msg)
-                else:
-                    print(mode_msg)
+                log.info("💡 維持原設定模式: %s", write_disposition)
         else:
-            success_msg = "✅ 無重複 order_sn"
-            if logger:
-                logger.info(success_msg)
-            else:
-                print(success_msg)
+            log.info("✅ 無重複 order_sn")
     else:
-        skip_msg = "ℹ️ 跳過重複檢查"
-        if logger:
-            logger.info(skip_msg)
-        else:
-            print(skip_msg)
+        log.info("ℹ️ 跳過重複檢查")
 
-    mode_msg = f"📊 使用模式: {final_write_disposition}"
-    if logger:
-        logger.info(mode_msg)
-    else:
-        print(mode_msg)
+    log.info("📊 使用模式: %s", final_write_disposition)
 
-    upload_csv_to_bq(
+    if not upload_arrow_table_to_bq(
         client,
-        csv_path,
+        table,
         dataset_id,
         table_id,
         schema,
         write_disposition=final_write_disposition,
-        logger=logger
-    )
+        logger=logger,
+        staging_bucket=staging_bucket,
+        credentials=get_bq_credentials(credential_path)
+    ):
+        log.error("❌ %s 上傳失敗: %s", table_id, csv_path)
 
 
 def interactive_mode():
@@ -257,8 +277,7 @@ def interactive_mode():
     elif choice == "4":
         logger.info("開始上傳所有檔案...")
         print("\n🚀 開始上傳所有檔案...")
-        for table_name, csv_path in DEFAULT_FILES.items():
-            upload_single_file(credential, csv_path, dataset, table_name, write_disposition, check_duplicates, logger)
+        upload_all_files(credential, dataset, write_disposition, check_duplicates, logger)
         logger.info("所有檔案上傳完成！")
         print("✅ 所有檔案上傳完成！")
     else:
@@ -5,8 +5,11 @@ BigQuery 工具函數模組
 
 主要功能：
 - BigQuery 客戶端建立與認證
-- CSV 檔案上傳至 BigQuery
-- 重複資料檢查與處理
+- 依檔名模式尋找最新的輸入檔案（單次 os.scandir 掃描）
+- CSV 檔案上傳至 BigQuery（支援經 GCS 暫存桶載入）
+- DataFrame 依 schema 轉為 Parquet 直接上傳（不落地暫存 CSV，可分片或依時間分區平行上傳）
+- 重複資料檢查與處理（支援分批串流檢查 order_sn）
+- 經暫存表以 MERGE 在 BigQuery 端去重寫入
 - 資料表存在性檢查
 - 資料表資訊查詢
 
@@ -14,30 +17,789 @@ Authors: 楊翔志 & AI Collective
 Studio: tranquility-base
 """
 
+import csv
+import fnmatch
+import gzip
+import io
+import logging
 import os
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from functools import lru_cache
+from google.auth.credentials import Credentials
 from google.cloud import bigquery
 from google.cloud.exceptions import NotFound
-from typing import List, Optional, Dict, Any
+from google.oauth2 import service_account
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+from typing import Iterable, List, Optional, Dict, Any
 
+# 未傳入 logger 時使用的模組 logger
+LOGGER = logging.getLogger(__name__)
 
+# GCS 可續傳上傳的分塊大小（需為 256 KB 的倍數）
+GCS_UPLOAD_CHUNK_SIZE = 32 * 1024 * 1024
+
+# 串流讀取 CSV 時每批的位元組數
+CSV_STREAM_BLOCK_SIZE = 16 * 1024 * 1024
+
+# 以 pyarrow 讀取 CSV 時預設視為 NULL 的字串：只有空欄位（同 BigQuery CSV 載入預設的 null_marker），
+# 不使用 pyarrow 預設清單，避免字串欄位中的 NA、N/A、null 等文字被當成 NULL
+CSV_NULL_VALUES = [""]
+
+# 串流上傳時 Parquet 暫存檔保留在記憶體的上限，超過後改寫到磁碟
+PARQUET_SPOOL_MAX_BYTES = 256 * 1024 * 1024
+
+# 分片上傳時同時進行的載入作業數
+SHARD_UPLOAD_MAX_WORKERS = 8
+
+# Storage Write API 每次 AppendRows 請求的資料量上限（API 限制為 10 MB，保留餘裕）
+WRITE_API_REQUEST_BYTES = 5 * 1024 * 1024
+
+# Storage Write API 平行寫入的串流數
+WRITE_API_STREAMS = 4
+
+# BigQuery 欄位型態 -> Arrow 型態（未列出者以字串處理）
+# TIMESTAMP 為絕對時間，需帶 UTC 時區，Parquet 才會標記為 isAdjustedToUTC 並載入為 TIMESTAMP
+BQ_TO_ARROW_TYPES = {
+    "STRING": pa.string(),
+    "INTEGER": pa.int64(),
+    "INT64": pa.int64(),
+    "FLOAT": pa.float64(),
+    "FLOAT64": pa.float64(),
+    "NUMERIC": pa.decimal128(38, 9),
+    "BOOLEAN": pa.bool_(),
+    "BOOL": pa.bool_(),
+    "DATE": pa.date32(),
+    "DATETIME": pa.timestamp("us"),
+    "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+    "TIME": pa.time64("us"),
+}
+
+# 時間分區類型 -> 分區修飾詞（table$...）格式
+PARTITION_DECORATOR_FORMATS = {
+    "DAY": "%Y%m%d",
+    "MONTH": "%Y%m",
+    "YEAR": "%Y",
+}
+
+# BigQuery 欄位型態 -> Storage Write API 的 proto2 欄位型態（未列出者以字串傳送）
+# DATE 為距 1970-01-01 的天數，TIMESTAMP 為距 epoch 的微秒數；DATETIME、TIME、NUMERIC 以字串傳送
+_PROTO_TYPES = descriptor_pb2.FieldDescriptorProto
+BQ_TO_PROTO_TYPES = {
+    "STRING": _PROTO_TYPES.TYPE_STRING,
+    "INTEGER": _PROTO_TYPES.TYPE_INT64,
+    "INT64": _PROTO_TYPES.TYPE_INT64,
+    "FLOAT": _PROTO_TYPES.TYPE_DOUBLE,
+    "FLOAT64": _PROTO_TYPES.TYPE_DOUBLE,
+    "BOOLEAN": _PROTO_TYPES.TYPE_BOOL,
+    "BOOL": _PROTO_TYPES.TYPE_BOOL,
+    "DATE": _PROTO_TYPES.TYPE_INT32,
+    "TIMESTAMP": _PROTO_TYPES.TYPE_INT64,
+}
+
+# 低基數（枚舉型）字串欄位，讀取時以字典編碼保存，避免大量重複字串
+LOW_CARDINALITY_COLUMNS = frozenset({
+    "platform",
+    "shop_name",
+    "order_type",
+    "order_status",
+    "shipping_status",
+    "shipping_method",
+    "shipping_provider",
+    "shipping_carrier",
+    "return_refund_status",
+    "pet_type",
+})
+
+
+@lru_cache(maxsize=4)
+def get_bq_credentials(credential_path: str) -> service_account.Credentials:
+    """載入服務帳號憑證（同一金鑰路徑只載入一次）
+
+    BigQuery 客戶端與 GCS 暫存、Storage Write API 客戶端共用同一份憑證。
+    """
+    return service_account.Credentials.from_service_account_file(
+        credential_path,
+        scopes=["https://www.googleapis.com/auth/cloud-platform"]
+    )
+
+
+@lru_cache(maxsize=4)
 def get_bq_client(credential_path: str) -> bigquery.Client:
-    """建立 BigQuery 客戶端"""
+    """建立 BigQuery 客戶端
+
+    直接以服務帳號金鑰建立憑證，不修改 GOOGLE_APPLICATION_CREDENTIALS 環境變數，
+    可安全地在多執行緒中使用；同一金鑰路徑的客戶端會被快取重複使用。
+    """
     try:
-        # 設定環境變數
-        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credential_path
+        # 載入服務帳號憑證
+        credentials = get_bq_credentials(credential_path)
         
         # 建立客戶端
-        client = bigquery.Client()
+        client = bigquery.Client(credentials=credentials, project=credentials.project_id)
         
-        print(f"✅ BigQuery 客戶端建立成功")
+        LOGGER.info("✅ BigQuery 客戶端建立成功")
         return client
         
     except Exception as e:
-        print(f"❌ BigQuery 客戶端建立失敗: {e}")
+        LOGGER.error("❌ BigQuery 客戶端建立失敗: %s", e)
         raise
 
 
+def find_latest_file(directory: str, name_pattern: str) -> Optional[str]:
+    """回傳目錄中符合檔名模式且修改時間最新的檔案路徑，找不到時回傳 None
+
+    以 os.scandir 單次掃描，檔案類型與修改時間取自目錄項目，邊掃描邊保留最新者。
+    """
+    latest_path = None
+    latest_mtime = None
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if fnmatch.fnmatch(entry.name, name_pattern) and entry.is_file():
+                    mtime = entry.stat().st_mtime
+                    if latest_mtime is None or mtime > latest_mtime:
+                        latest_path, latest_mtime = entry.path, mtime
+    except FileNotFoundError:
+        return None
+    return latest_path
+
+
+def read_csv_header(csv_path: str) -> List[str]:
+    """只讀取 CSV 標題列取得欄位名稱（自動略過 UTF-8 BOM）"""
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        return next(csv.reader(f), [])
+
+
+def read_csv_as_strings(csv_path: str) -> pa.Table:
+    """以 pyarrow 多執行緒解析 CSV，所有欄位保持為字串且不辨識空值
+
+    相當於 pd.read_csv(dtype=str, keep_default_na=False, na_filter=False)。
+    """
+    column_types = {name: pa.string() for name in read_csv_header(csv_path)}
+    return pacsv.read_csv(
+        csv_path,
+        convert_options=pacsv.ConvertOptions(column_types=column_types, strings_can_be_null=False),
+    )
+
+
+def _arrow_csv_types(schema: List[bigquery.SchemaField]):
+    """依 BigQuery schema 取得目標 Arrow 型態，以及 CSV 解析時使用的型態
+
+    低基數的字串欄位以字典編碼讀入，相同值只存一份；
+    pyarrow 無法將不含時區的字串直接解析為帶時區的 timestamp，解析時先以無時區讀入。
+    """
+    column_types = {
+        field.name: BQ_TO_ARROW_TYPES.get(field.field_type.upper(), pa.string())
+        for field in schema
+    }
+    for name in LOW_CARDINALITY_COLUMNS.intersection(column_types):
+        if column_types[name] == pa.string():
+            column_types[name] = pa.dictionary(pa.int32(), pa.string())
+    csv_types = {name: _without_timezone(arrow_type) for name, arrow_type in column_types.items()}
+    return column_types, csv_types
+
+
+def read_csv_as_arrow(
+    csv_path: str,
+    schema: List[bigquery.SchemaField],
+    null_values: Optional[List[str]] = None
+) -> pa.Table:
+    """依 BigQuery schema 的欄位型態以 pyarrow 讀取 CSV，只保留 schema 內的欄位
+
+    低基數的字串欄位以字典編碼讀入，相同值只存一份。
+    null_values 指定視為 NULL 的字串（含字串欄位），未指定時只有空欄位視為 NULL（同 BigQuery CSV 預設的 null_marker）。
+    """
+    column_types, csv_types = _arrow_csv_types(schema)
+    table = pacsv.read_csv(
+        csv_path,
+        convert_options=pacsv.ConvertOptions(
+            column_types=csv_types,
+            strings_can_be_null=True,
+            null_values=null_values if null_values is not None else CSV_NULL_VALUES,
+        ),
+    )
+
+    # Parquet 依欄位名稱載入，只保留 schema 內的欄位；無時區的時間依 BigQuery CSV 慣例視為 UTC
+    return pa.table({
+        field.name: table.column(field.name).cast(column_types[field.name])
+        for field in schema if field.name in table.column_names
+    })
+
+
+def iter_csv_as_arrow(
+    csv_path: str,
+    schema: List[bigquery.SchemaField],
+    null_values: Optional[List[str]] = None,
+    block_size: int = CSV_STREAM_BLOCK_SIZE
+) -> Iterable[pa.RecordBatch]:
+    """與 read_csv_as_arrow 相同的型態規則，但以串流方式分批讀取 CSV
+
+    每次只解析 block_size 位元組，峰值記憶體與檔案大小無關；只讀取 schema 內的欄位。
+    """
+    column_types, csv_types = _arrow_csv_types(schema)
+    header = set(read_csv_header(csv_path))
+    names = [field.name for field in schema if field.name in header]
+    reader = pacsv.open_csv(
+        csv_path,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=names,
+            column_types={name: csv_types[name] for name in names},
+            strings_can_be_null=True,
+            null_values=null_values if null_values is not None else CSV_NULL_VALUES,
+        ),
+    )
+    for batch in reader:
+        yield pa.record_batch(
+            [batch.column(name).cast(column_types[name]) for name in names],
+            names=names
+        )
+
+
+def _without_timezone(arrow_type: pa.DataType) -> pa.DataType:
+    """帶時區的 timestamp 型態改為同精度的無時區型態，其他型態不變"""
+    if pa.types.is_timestamp(arrow_type) and arrow_type.tz is not None:
+        return pa.timestamp(arrow_type.unit)
+    return arrow_type
+
+
+def dataframe_to_arrow(df: pd.DataFrame, schema: List[bigquery.SchemaField]) -> pa.Table:
+    """將 DataFrame 依 BigQuery schema 轉為型態正確的 Arrow 資料表
+
+    字串欄位中的空字串視為 NULL（與 BigQuery 載入 CSV 空欄位的行為一致），只保留 schema 內的欄位。
+    """
+    source = pa.Table.from_pandas(df, preserve_index=False)
+    columns = {}
+    for field in schema:
+        if field.name not in source.column_names:
+            continue
+        target_type = BQ_TO_ARROW_TYPES.get(field.field_type.upper(), pa.string())
+        column = source.column(field.name)
+        if pa.types.is_string(column.type):
+            column = pc.if_else(pc.equal(column, ""), pa.scalar(None, column.type), column)
+            if pa.types.is_time(target_type):
+                # pyarrow 不支援字串直接轉 time，先補上日期轉為 timestamp
+                column = pc.binary_join_element_wise("1970-01-01 ", column, "").cast(pa.timestamp("us"))
+            else:
+                column = column.cast(_without_timezone(target_type))
+        columns[field.name] = column.cast(target_type)
+    return pa.table(columns)
+
+
+def load_file_to_bq(
+    client: bigquery.Client,
+    source_file,
+    source_name: str,
+    table_ref,
+    table_id: str,
+    job_config: bigquery.LoadJobConfig,
+    logger=None,
+    staging_bucket: Optional[str] = None,
+    credentials: Optional[Credentials] = None
+) -> bigquery.LoadJob:
+    """將檔案物件載入 BigQuery，指定 staging_bucket 時先經 GCS 暫存，回傳完成的載入作業
+
+    credentials 為建立 GCS 客戶端使用的憑證（通常為 get_bq_credentials 的結果），未指定時使用預設憑證。
+    """
+    log = logger or LOGGER
+    if staging_bucket:
+        # 先上傳至 GCS 暫存桶，再由 BigQuery 從 GCS 載入
+        from google.cloud import storage
+
+        storage_client = storage.Client(project=client.project, credentials=credentials)
+        blob = storage_client.bucket(staging_bucket).blob(f"staging/{table_id}/{source_name}")
+        blob.chunk_size = GCS_UPLOAD_CHUNK_SIZE
+        blob.upload_from_file(source_file, rewind=True)
+
+        source_uri = f"gs://{staging_bucket}/{blob.name}"
+        log.info("☁️ 已上傳至 GCS 暫存: %s", source_uri)
+
+        try:
+            job = client.load_table_from_uri(
+                source_uri,
+                table_ref,
+                job_config=job_config
+            )
+            # 等待完成
+            job.result()
+        finally:
+            # 清理 GCS 暫存物件
+            blob.delete()
+    else:
+        job = client.load_table_from_file(
+            source_file,
+            table_ref,
+            job_config=job_config
+        )
+
+        # 等待完成
+        job.result()
+    return job
+
+
+def gzip_to_buffer(source_file, compresslevel: int = 1) -> io.BytesIO:
+    """以 gzip 串流壓縮檔案內容至記憶體緩衝區（level 1 以速度為主）"""
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=compresslevel) as gz:
+        shutil.copyfileobj(source_file, gz, CSV_STREAM_BLOCK_SIZE)
+    buffer.seek(0)
+    return buffer
+
+
+def upload_arrow_table_to_bq(
+    client: bigquery.Client,
+    table: pa.Table,
+    dataset_id: str,
+    table_id: str,
+    schema: List[bigquery.SchemaField],
+    write_disposition: str = "WRITE_APPEND",
+    logger=None,
+    staging_bucket: Optional[str] = None,
+    credentials: Optional[Credentials] = None,
+    create_disposition: str = "CREATE_IF_NEEDED"
+) -> bool:
+    """將已讀入記憶體的 Arrow 資料表以 Snappy 壓縮的 Parquet 上傳至 BigQuery（不落地暫存檔）"""
+    log = logger or LOGGER
+    try:
+        # 建立 table 參考
+        table_ref = client.dataset(dataset_id).table(table_id)
+
+        # 於記憶體中序列化為 Parquet
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer, compression="snappy")
+        buffer.seek(0)
+        log.info("🗜️ 已轉換為 Parquet: %s 筆資料 (%.2f MB)", table.num_rows, buffer.getbuffer().nbytes / 1024 / 1024)
+
+        # 設定 job config
+        job_config = bigquery.LoadJobConfig(
+            schema=schema,
+            write_disposition=write_disposition,
+            create_disposition=create_disposition,
+            source_format=bigquery.SourceFormat.PARQUET,
+        )
+
+        # 執行上傳
+        log.info("📤 開始上傳至 %s.%s...", dataset_id, table_id)
+
+        # 暫存物件名稱加上亂數，避免平行上傳時互相覆蓋
+        source_name = f"{table_id}_{uuid.uuid4().hex}.parquet"
+        load_file_to_bq(client, buffer, source_name, table_ref, table_id, job_config, logger, staging_bucket, credentials)
+
+        # 檢查結果（分區修飾詞 table$YYYYMMDD 只用於載入，查詢資料表資訊時去除）
+        bq_table = client.get_table(client.dataset(dataset_id).table(table_id.split("$")[0]))
+        log.info("✅ 上傳成功！資料表 %s 共有 %s 筆資料", table_id, bq_table.num_rows)
+
+        return True
+
+    except Exception as e:
+        log.error("❌ 上傳失敗: %s", e)
+        return False
+
+
+def upload_csv_stream_to_bq(
+    client: bigquery.Client,
+    csv_path: str,
+    dataset_id: str,
+    table_id: str,
+    schema: List[bigquery.SchemaField],
+    write_disposition: str = "WRITE_APPEND",
+    logger=None,
+    staging_bucket: Optional[str] = None,
+    credentials: Optional[Credentials] = None,
+    create_disposition: str = "CREATE_IF_NEEDED",
+    null_values: Optional[List[str]] = None,
+    constant_columns: Optional[Dict[str, pa.Scalar]] = None,
+    block_size: int = CSV_STREAM_BLOCK_SIZE
+) -> bool:
+    """以串流方式分批讀取 CSV，逐批寫入 Parquet 暫存檔後以單一載入作業上傳
+
+    峰值記憶體只與 block_size 成正比，適合無法整份讀入記憶體的大型檔案；
+    暫存檔超過 PARQUET_SPOOL_MAX_BYTES 才寫到磁碟，結束後自動刪除。
+    constant_columns 為每批附加的常數欄位（例如 processing_date）。
+    """
+    log = logger or LOGGER
+    constant_columns = constant_columns or {}
+    try:
+        column_types, _ = _arrow_csv_types(schema)
+        header = set(read_csv_header(csv_path))
+        arrow_schema = pa.schema(
+            [(field.name, column_types[field.name]) for field in schema if field.name in header]
+            + [(name, value.type) for name, value in constant_columns.items()]
+        )
+
+        with tempfile.SpooledTemporaryFile(max_size=PARQUET_SPOOL_MAX_BYTES) as buffer:
+            writer = pq.ParquetWriter(buffer, arrow_schema, compression="snappy")
+            rows = 0
+            try:
+                for batch in iter_csv_as_arrow(csv_path, schema, null_values=null_values, block_size=block_size):
+                    for name, value in constant_columns.items():
+                        batch = batch.append_column(name, pa.repeat(value, batch.num_rows))
+                    writer.write_batch(batch)
+                    rows += batch.num_rows
+            finally:
+                writer.close()
+            log.info("🗜️ 已串流轉換為 Parquet: %s 筆資料 (%.2f MB)", rows, buffer.tell() / 1024 / 1024)
+            buffer.seek(0)
+
+            job_config = bigquery.LoadJobConfig(
+                schema=schema,
+                write_disposition=write_disposition,
+                create_disposition=create_disposition,
+                source_format=bigquery.SourceFormat.PARQUET,
+            )
+            log.info("📤 開始上傳至 %s.%s...", dataset_id, table_id)
+            table_ref = client.dataset(dataset_id).table(table_id)
+            source_name = f"{table_id}_{uuid.uuid4().hex}.parquet"
+            load_file_to_bq(client, buffer, source_name, table_ref, table_id, job_config, logger, staging_bucket, credentials)
+
+        bq_table = client.get_table(table_ref)
+        log.info("✅ 上傳成功！資料表 %s 共有 %s 筆資料", table_id, bq_table.num_rows)
+        return True
+
+    except Exception as e:
+        log.error("❌ 上傳失敗: %s", e)
+        return False
+
+
+def upload_arrow_table_in_shards(
+    client: bigquery.Client,
+    table: pa.Table,
+    dataset_id: str,
+    table_id: str,
+    schema: List[bigquery.SchemaField],
+    shard_rows: int,
+    write_disposition: str = "WRITE_APPEND",
+    logger=None,
+    staging_bucket: Optional[str] = None,
+    credentials: Optional[Credentials] = None,
+    create_disposition: str = "CREATE_IF_NEEDED",
+    max_workers: int = SHARD_UPLOAD_MAX_WORKERS
+) -> bool:
+    """將 Arrow 資料表切成每片最多 shard_rows 筆，以多個 Parquet 載入作業平行上傳
+
+    第一片依 write_disposition 寫入（覆蓋或空表檢查），完成後其餘分片以 WRITE_APPEND 平行送出。
+    分片上傳不是單一交易：部分分片失敗時，資料表會只含成功的分片。
+    """
+    log = logger or LOGGER
+    shards = [table.slice(offset, shard_rows) for offset in range(0, table.num_rows, shard_rows)] or [table]
+    log.info("🧩 切分為 %s 個分片上傳（每片最多 %s 筆，%s 個作業同時進行）", len(shards), shard_rows, max_workers)
+
+    if not upload_arrow_table_to_bq(
+        client, shards[0], dataset_id, table_id, schema,
+        write_disposition=write_disposition,
+        logger=logger,
+        staging_bucket=staging_bucket,
+        credentials=credentials,
+        create_disposition=create_disposition
+    ):
+        return False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(
+            lambda shard: upload_arrow_table_to_bq(
+                client, shard, dataset_id, table_id, schema,
+                write_disposition="WRITE_APPEND",
+                logger=logger,
+                staging_bucket=staging_bucket,
+                credentials=credentials
+            ),
+            shards[1:]
+        ))
+
+    failed = results.count(False)
+    if failed:
+        log.error("❌ %s/%s 個分片上傳失敗，資料表可能只含部分資料", failed, len(shards))
+        return False
+    return True
+
+
+def upload_arrow_table_by_partition(
+    client: bigquery.Client,
+    table: pa.Table,
+    dataset_id: str,
+    table_id: str,
+    schema: List[bigquery.SchemaField],
+    write_disposition: str = "WRITE_APPEND",
+    logger=None,
+    staging_bucket: Optional[str] = None,
+    credentials: Optional[Credentials] = None,
+    max_workers: int = SHARD_UPLOAD_MAX_WORKERS
+) -> bool:
+    """依目標資料表的時間分區切分 Arrow 資料表，以分區修飾詞（table$YYYYMMDD）平行載入各分區
+
+    每個分區各自依 write_disposition 寫入：WRITE_TRUNCATE 只覆蓋資料中出現的分區，其餘分區保留。
+    目標資料表須已存在且以欄位做 DAY/MONTH/YEAR 時間分區，否則改為單一載入作業。
+    分區載入不是單一交易：部分分區失敗時，資料表只會更新成功的分區。
+    """
+    log = logger or LOGGER
+    try:
+        partitioning = client.get_table(client.dataset(dataset_id).table(table_id)).time_partitioning
+    except NotFound:
+        partitioning = None
+    decorator_format = PARTITION_DECORATOR_FORMATS.get(partitioning.type_) if partitioning else None
+    if decorator_format is None or partitioning.field not in table.column_names:
+        log.warning("⚠️ 資料表 %s 不存在或未以欄位做 DAY/MONTH/YEAR 分區，改為單一載入作業", table_id)
+        return upload_arrow_table_to_bq(
+            client, table, dataset_id, table_id, schema,
+            write_disposition=write_disposition,
+            logger=logger,
+            staging_bucket=staging_bucket,
+            credentials=credentials
+        )
+
+    # 依分區欄位算出每列的分區代碼，NULL 值歸入 __NULL__ 分區
+    column = table.column(partitioning.field)
+    if pa.types.is_date(column.type):
+        column = column.cast(pa.timestamp("s"))
+    keys = pc.fill_null(pc.strftime(column, format=decorator_format), "__NULL__")
+    partitions = [(key, table.filter(pc.equal(keys, key))) for key in pc.unique(keys).to_pylist()]
+    log.info("🧩 依 %s 切分為 %s 個%s分區上傳（%s 個作業同時進行）",
+             partitioning.field, len(partitions), partitioning.type_, max_workers)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(
+            lambda partition: upload_arrow_table_to_bq(
+                client, partition[1], dataset_id, f"{table_id}${partition[0]}", schema,
+                write_disposition=write_disposition,
+                logger=logger,
+                staging_bucket=staging_bucket,
+                credentials=credentials,
+                create_disposition="CREATE_NEVER"
+            ),
+            partitions
+        ))
+
+    failed = results.count(False)
+    if failed:
+        log.error("❌ %s/%s 個分區上傳失敗，資料表可能只更新部分分區", failed, len(partitions))
+        return False
+    return True
+
+
+def _build_write_api_message(schema: List[bigquery.SchemaField]):
+    """依 BigQuery schema 動態建立 Storage Write API 使用的 proto2 訊息描述與類別"""
+    file_proto = descriptor_pb2.FileDescriptorProto(name="bq_write_row.proto", package="bq_write", syntax="proto2")
+    message_proto = file_proto.message_type.add(name="Row")
+    for number, field in enumerate(schema, start=1):
+        message_proto.field.add(
+            name=field.name,
+            number=number,
+            type=BQ_TO_PROTO_TYPES.get(field.field_type, _PROTO_TYPES.TYPE_STRING),
+            label=_PROTO_TYPES.LABEL_OPTIONAL,
+        )
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    message_class = message_factory.GetMessageClass(pool.FindMessageTypeByName("bq_write.Row"))
+    return message_proto, message_class
+
+
+def _arrow_column_for_write_api(column, field_type: str):
+    """將 Arrow 欄位轉為 Storage Write API 欄位型態對應的值"""
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+    if field_type == "DATE":
+        return column.cast(pa.int32())
+    if field_type == "TIMESTAMP":
+        return column.cast(pa.int64())
+    if field_type == "DATETIME":
+        return pc.strftime(column, format="%Y-%m-%d %H:%M:%S")
+    if field_type not in BQ_TO_PROTO_TYPES and not pa.types.is_string(column.type):
+        return column.cast(pa.string())
+    return column
+
+
+def _serialize_write_api_rows(table: pa.Table, schema: List[bigquery.SchemaField], message_class) -> Iterable[List[bytes]]:
+    """將 Arrow 資料表逐列序列化為 proto，依 WRITE_API_REQUEST_BYTES 分批產出"""
+    names = [field.name for field in schema if field.name in table.column_names]
+    columns = [
+        _arrow_column_for_write_api(table.column(field.name), field.field_type).to_pylist()
+        for field in schema if field.name in table.column_names
+    ]
+
+    batch, batch_bytes = [], 0
+    for values in zip(*columns):
+        message = message_class()
+        for name, value in zip(names, values):
+            if value is not None:
+                setattr(message, name, value)
+        row = message.SerializeToString()
+
+        if batch and batch_bytes + len(row) > WRITE_API_REQUEST_BYTES:
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(row)
+        batch_bytes += len(row)
+    if batch:
+        yield batch
+
+
+def _append_to_write_stream(write_client, parent: str, table: pa.Table, schema: List[bigquery.SchemaField], message_proto, message_class) -> str:
+    """建立 PENDING 串流，寫入資料後 finalize，回傳串流名稱（尚未提交）"""
+    from google.cloud.bigquery_storage_v1 import types, writer
+
+    write_stream = write_client.create_write_stream(
+        parent=parent,
+        write_stream=types.WriteStream(type_=types.WriteStream.Type.PENDING)
+    )
+    request_template = types.AppendRowsRequest(
+        write_stream=write_stream.name,
+        proto_rows=types.AppendRowsRequest.ProtoData(
+            writer_schema=types.ProtoSchema(proto_descriptor=message_proto)
+        )
+    )
+    append_rows_stream = writer.AppendRowsStream(write_client, request_template)
+
+    try:
+        offset = 0
+        futures = []
+        for batch in _serialize_write_api_rows(table, schema, message_class):
+            request = types.AppendRowsRequest(
+                offset=offset,
+                proto_rows=types.AppendRowsRequest.ProtoData(rows=types.ProtoRows(serialized_rows=batch))
+            )
+            futures.append(append_rows_stream.send(request))
+            offset += len(batch)
+        for future in futures:
+            future.result()
+    finally:
+        append_rows_stream.close()
+
+    write_client.finalize_write_stream(name=write_stream.name)
+    return write_stream.name
+
+
+def upload_arrow_table_via_write_api(
+    client: bigquery.Client,
+    table: pa.Table,
+    dataset_id: str,
+    table_id: str,
+    schema: List[bigquery.SchemaField],
+    logger=None,
+    streams: int = WRITE_API_STREAMS,
+    write_disposition: str = "WRITE_APPEND",
+    credentials: Optional[Credentials] = None
+) -> bool:
+    """以 BigQuery Storage Write API 追加寫入 Arrow 資料表，不佔用載入作業配額
+
+    資料切成 streams 份，以 PENDING 串流平行寫入，全部完成後以 batch commit 一次提交
+    （任一串流失敗則整批不提交）。只支援追加寫入；需安裝 google-cloud-bigquery-storage。
+    credentials 為建立 Storage Write API 客戶端使用的憑證，未指定時使用預設憑證。
+    """
+    log = logger or LOGGER
+    if write_disposition != "WRITE_APPEND":
+        log.error("❌ Storage Write API 只支援追加寫入 (WRITE_APPEND)，目前模式: %s", write_disposition)
+        return False
+
+    try:
+        from google.cloud import bigquery_storage_v1
+        from google.cloud.bigquery_storage_v1 import types
+    except ImportError:
+        log.error("❌ 使用 Storage Write API 需安裝 google-cloud-bigquery-storage")
+        return False
+
+    try:
+        # 串流寫入需要資料表已存在
+        table_ref = client.dataset(dataset_id).table(table_id)
+        client.create_table(bigquery.Table(table_ref, schema=schema), exists_ok=True)
+        if table.num_rows == 0:
+            log.info("ℹ️ 無資料需要寫入")
+            return True
+
+        write_client = bigquery_storage_v1.BigQueryWriteClient(credentials=credentials)
+        parent = write_client.table_path(client.project, dataset_id, table_id)
+        message_proto, message_class = _build_write_api_message(schema)
+
+        slice_rows = -(-table.num_rows // streams)
+        slices = [table.slice(offset, slice_rows) for offset in range(0, table.num_rows, slice_rows)]
+        log.info("📡 以 Storage Write API 寫入 %s 筆資料至 %s.%s（%s 個串流）", table.num_rows, dataset_id, table_id, len(slices))
+
+        with ThreadPoolExecutor(max_workers=len(slices)) as executor:
+            stream_names = list(executor.map(
+                lambda part: _append_to_write_stream(write_client, parent, part, schema, message_proto, message_class),
+                slices
+            ))
+
+        response = write_client.batch_commit_write_streams(
+            types.BatchCommitWriteStreamsRequest(parent=parent, write_streams=stream_names)
+        )
+        if response.stream_errors:
+            for error in response.stream_errors:
+                log.error("❌ 串流提交失敗: %s", error.error_message)
+            return False
+
+        bq_table = client.get_table(table_ref)
+        log.info("✅ 寫入成功！資料表 %s 共有 %s 筆資料", table_id, bq_table.num_rows)
+        return True
+
+    except Exception as e:
+        log.error("❌ Storage Write API 寫入失敗: %s", e)
+        return False
+
+
+def upload_dataframe_to_bq(
+    client: bigquery.Client,
+    df: pd.DataFrame,
+    dataset_id: str,
+    table_id: str,
+    schema: List[bigquery.SchemaField],
+    write_disposition: str = "WRITE_APPEND",
+    logger=None,
+    staging_bucket: Optional[str] = None,
+    credentials: Optional[Credentials] = None,
+    create_disposition: str = "CREATE_IF_NEEDED",
+    shard_rows: Optional[int] = None,
+    use_storage_write: bool = False
+) -> bool:
+    """將 DataFrame 依 schema 轉型後以 Parquet 直接上傳至 BigQuery，不需先寫出暫存 CSV
+
+    指定 shard_rows 時改以分片平行上傳（見 upload_arrow_table_in_shards）；
+    use_storage_write 為 True 時改以 Storage Write API 追加寫入（見 upload_arrow_table_via_write_api）。
+    """
+    log = logger or LOGGER
+    try:
+        table = dataframe_to_arrow(df, schema)
+    except Exception as e:
+        log.error("❌ DataFrame 轉換為 Arrow 失敗: %s", e)
+        return False
+
+    if use_storage_write:
+        return upload_arrow_table_via_write_api(
+            client, table, dataset_id, table_id, schema,
+            logger=logger,
+            write_disposition=write_disposition,
+            credentials=credentials
+        )
+
+    if shard_rows:
+        return upload_arrow_table_in_shards(
+            client, table, dataset_id, table_id, schema, shard_rows,
+            write_disposition=write_disposition,
+            logger=logger,
+            staging_bucket=staging_bucket,
+            credentials=credentials,
+            create_disposition=create_disposition
+        )
+
+    return upload_arrow_table_to_bq(
+        client, table, dataset_id, table_id, schema,
+        write_disposition=write_disposition,
+        logger=logger,
+        staging_bucket=staging_bucket,
+        credentials=credentials,
+        create_disposition=create_disposition
+    )
+
+
 def upload_csv_to_bq(
     client: bigquery.Client,
     csv_path: str,
@@ -45,34 +807,60 @@ def upload_csv_to_bq(
     table_id: str,
     schema: List[bigquery.SchemaField],
     write_disposition: str = "WRITE_APPEND",
-    logger=None
+    logger=None,
+    staging_bucket: Optional[str] = None,
+    credentials: Optional[Credentials] = None,
+    as_parquet: bool = False,
+    create_disposition: str = "CREATE_IF_NEEDED",
+    gzip_csv: bool = False,
+    use_storage_write: bool = False
 ) -> bool:
-    """上傳 CSV 檔案至 BigQuery"""
+    """上傳 CSV 檔案至 BigQuery
+
+    指定 staging_bucket 時，先以可續傳上傳將 CSV 放到 GCS 暫存桶，
+    再以 load_table_from_uri 由 BigQuery 直接從 GCS 載入，完成後刪除暫存物件。
+    as_parquet 為 True 時，先依 schema 將 CSV 轉為 Snappy 壓縮的 Parquet 再上傳。
+    CSV 載入採嚴格解析（不允許欄位缺漏、引號內換行與壞資料列），遇到異常檔案直接失敗；
+    資料表已存在時可指定 create_disposition="CREATE_NEVER" 避免意外建立新表。
+    gzip_csv 為 True 時，先以 gzip 壓縮 CSV 再送出以減少傳輸量；
+    BigQuery 無法平行解析 gzip 檔案，且單檔上限為 4 GB，適合頻寬受限的環境。
+    use_storage_write 為 True 時，依 schema 讀成 Arrow 後以 Storage Write API 追加寫入，不使用載入作業。
+    """
+    log = logger or LOGGER
     try:
         # 檢查檔案是否存在
         if not os.path.exists(csv_path):
-            error_msg = f"❌ CSV 檔案不存在: {csv_path}"
-            if logger:
-                logger.error(error_msg)
-            else:
-                print(error_msg)
+            log.error("❌ CSV 檔案不存在: %s", csv_path)
             return False
             
         # 檢查檔案大小
         file_size = os.path.getsize(csv_path)
         if file_size == 0:
-            error_msg = f"❌ CSV 檔案為空: {csv_path}"
-            if logger:
-                logger.error(error_msg)
-            else:
-                print(error_msg)
+            log.error("❌ CSV 檔案為空: %s", csv_path)
             return False
             
-        size_msg = f"📊 CSV 檔案大小: {file_size / 1024 / 1024:.2f} MB"
-        if logger:
-            logger.info(size_msg)
-        else:
-            print(size_msg)
+        log.info("📊 CSV 檔案大小: %.2f MB", file_size / 1024 / 1024)
+
+        if use_storage_write:
+            table = read_csv_as_arrow(csv_path, schema)
+            return upload_arrow_table_via_write_api(
+                client, table, dataset_id, table_id, schema,
+                logger=logger,
+                write_disposition=write_disposition,
+                credentials=credentials
+            )
+
+        if as_parquet:
+            # 先依 schema 轉為 Parquet，BigQuery 端不需再解析 CSV 文字
+            table = read_csv_as_arrow(csv_path, schema)
+            return upload_arrow_table_to_bq(
+                client, table, dataset_id, table_id, schema,
+                write_disposition=write_disposition,
+                logger=logger,
+                staging_bucket=staging_bucket,
+                credentials=credentials,
+                create_disposition=create_disposition
+            )
         
         # 建立 table 參考
         table_ref = client.dataset(dataset_id).table(table_id)
@@ -81,67 +869,216 @@ def upload_csv_to_bq(
         job_config = bigquery.LoadJobConfig(
             schema=schema,
             write_disposition=write_disposition,
+            create_disposition=create_disposition,
             source_format=bigquery.SourceFormat.CSV,
             skip_leading_rows=1,  # 跳過標題行
             autodetect=False,  # 使用自定義 schema
+            # 明確指定 CSV 解析規則，採嚴格模式，異常檔案直接失敗
+            field_delimiter=",",
+            quote_character='"',
+            encoding="UTF-8",
+            allow_quoted_newlines=False,
+            allow_jagged_rows=False,
+            ignore_unknown_values=False,
+            max_bad_records=0,
         )
         
         # 執行上傳
-        upload_msg = f"📤 開始上傳至 {dataset_id}.{table_id}..."
-        if logger:
-            logger.info(upload_msg)
-        else:
-            print(upload_msg)
+        log.info("📤 開始上傳至 %s.%s...", dataset_id, table_id)
         
         with open(csv_path, "rb") as source_file:
-            job = client.load_table_from_file(
-                source_file,
-                table_ref,
-                job_config=job_config
-            )
-            
-        # 等待完成
-        job.result()
+            source_name = os.path.basename(csv_path)
+            if gzip_csv:
+                source_file = gzip_to_buffer(source_file)
+                source_name += ".gz"
+                log.info("🗜️ 已以 gzip 壓縮: %.2f MB", source_file.getbuffer().nbytes / 1024 / 1024)
+            load_file_to_bq(client, source_file, source_name, table_ref, table_id, job_config, logger, staging_bucket, credentials)
         
         # 檢查結果
         table = client.get_table(table_ref)
-        success_msg = f"✅ 上傳成功！資料表 {table_id} 共有 {table.num_rows} 筆資料"
-        if logger:
-            logger.info(success_msg)
-        else:
-            print(success_msg)
+        log.info("✅ 上傳成功！資料表 %s 共有 %s 筆資料", table_id, table.num_rows)
         
         return True
         
     except Exception as e:
-        error_msg = f"❌ 上傳失敗: {e}"
-        if logger:
-            logger.error(error_msg)
-        else:
-            print(error_msg)
+        log.error("❌ 上傳失敗: %s", e)
         return False
 
 
+def merge_arrow_table_to_bq(
+    client: bigquery.Client,
+    table: pa.Table,
+    dataset_id: str,
+    table_id: str,
+    schema: List[bigquery.SchemaField],
+    key_column: str = "order_sn",
+    order_column: Optional[str] = "processing_date",
+    logger=None,
+    staging_bucket: Optional[str] = None,
+    credentials: Optional[Credentials] = None
+) -> bool:
+    """經暫存表以 MERGE 寫入 BigQuery，由 BigQuery 端依 key_column 去重
+
+    先將資料以 WRITE_TRUNCATE 載入 {table_id}__staging_{時間戳}_{亂數} 暫存表（同一資料表同時執行也不會互相覆蓋），
+    同一 key 只保留 order_column 最新的一筆後 MERGE 進目標表（存在則更新、不存在則新增），
+    完成後刪除暫存表。目標表不存在時先依 schema 建立。
+    """
+    log = logger or LOGGER
+    table_ref = client.dataset(dataset_id).table(table_id)
+    staging_table_id = f"{table_id}__staging_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    staging_ref = client.dataset(dataset_id).table(staging_table_id)
+
+    try:
+        if not check_table_exists(client, dataset_id, table_id):
+            client.create_table(bigquery.Table(table_ref, schema=list(schema)))
+            log.info("🆕 已建立資料表: %s.%s", dataset_id, table_id)
+
+        # 載入暫存表
+        if not upload_arrow_table_to_bq(
+            client, table, dataset_id, staging_table_id, schema,
+            write_disposition="WRITE_TRUNCATE",
+            logger=logger,
+            staging_bucket=staging_bucket,
+            credentials=credentials
+        ):
+            return False
+
+        columns = [field.name for field in schema]
+        order_by = order_column if order_column in columns else key_column
+        target = f"`{client.project}.{dataset_id}.{table_id}`"
+        source = f"`{client.project}.{dataset_id}.{staging_table_id}`"
+        merge_sql = f"""
+            MERGE {target} T
+            USING (
+                SELECT * EXCEPT(rn) FROM (
+                    SELECT *, ROW_NUMBER() OVER (PARTITION BY `{key_column}` ORDER BY `{order_by}` DESC) AS rn
+                    FROM {source}
+                )
+                WHERE rn = 1
+            ) S
+            ON T.`{key_column}` = S.`{key_column}`
+            WHEN MATCHED THEN
+                UPDATE SET {", ".join(f"`{col}` = S.`{col}`" for col in columns if col != key_column)}
+            WHEN NOT MATCHED THEN
+                INSERT ({", ".join(f"`{col}`" for col in columns)}) VALUES ({", ".join(f"S.`{col}`" for col in columns)})
+        """
+
+        log.info("🔀 以 MERGE 寫入 %s.%s（依 %s 去重）...", dataset_id, table_id, key_column)
+
+        job = client.query(merge_sql)
+        job.result()
+
+        log.info("✅ MERGE 完成！影響 %s 筆資料", job.num_dml_affected_rows)
+
+        return True
+
+    except Exception as e:
+        log.error("❌ MERGE 失敗: %s", e)
+        return False
+
+    finally:
+        # 清理暫存表
+        client.delete_table(staging_ref, not_found_ok=True)
+
+
 def check_duplicate_order_sn(df: pd.DataFrame) -> Optional[List[str]]:
     """檢查 order_sn 重複"""
     try:
         if 'order_sn' not in df.columns:
-            print("⚠️ 資料框中沒有 order_sn 欄位")
+            LOGGER.warning("⚠️ 資料框中沒有 order_sn 欄位")
             return None
             
-        # 找出重複的 order_sn
-        duplicates = df[df['order_sn'].duplicated(keep=False)]
+        # 單次雜湊掃描標記第二次以後出現的 order_sn，再取唯一值（依首次重複的順序，不需排序計數）
+        order_sn = df['order_sn']
+        duplicate_sns = order_sn[order_sn.duplicated()].unique().tolist()
         
-        if len(duplicates) > 0:
-            duplicate_sns = duplicates['order_sn'].unique().tolist()
-            print(f"⚠️ 發現 {len(duplicate_sns)} 個重複的 order_sn")
+        if duplicate_sns:
+            LOGGER.warning("⚠️ 發現 %s 個重複的 order_sn", len(duplicate_sns))
             return duplicate_sns
         else:
-            print("✅ 無重複的 order_sn")
+            LOGGER.info("✅ 無重複的 order_sn")
             return None
             
     except Exception as e:
-        print(f"❌ 檢查重複時發生錯誤: {e}")
+        LOGGER.error("❌ 檢查重複時發生錯誤: %s", e)
+        return None
+
+
+def find_duplicate_keys(arrays: Iterable[pa.Array]) -> List[Any]:
+    """逐批掃描鍵值，以雜湊集合找出出現超過一次的鍵（依首次重複的順序回傳）
+
+    供串流讀取時使用；已完整讀入的資料表改用 pc.value_counts 向量化計數。
+    """
+    seen = set()
+    duplicates: Dict[Any, None] = {}
+    for array in arrays:
+        for value in array.to_pylist():
+            if value in seen:
+                duplicates[value] = None
+            else:
+                seen.add(value)
+    return list(duplicates)
+
+
+def drop_duplicate_keys(table: pa.Table, key_column: str) -> pa.Table:
+    """依 key_column 去除重複列，每個鍵保留最後一筆並維持原始順序（同 drop_duplicates(keep='last')）"""
+    row_numbers = pa.table({
+        "key": table.column(key_column),
+        "row": pa.array(range(table.num_rows), pa.int64()),
+    })
+    last_rows = row_numbers.group_by("key", use_threads=False).aggregate([("row", "max")]).column("row_max")
+    return table.take(pc.take(last_rows, pc.sort_indices(last_rows)))
+
+
+def check_duplicate_order_sn_table(table: pa.Table) -> Optional[List[str]]:
+    """檢查已讀入的 Arrow 資料表中 order_sn 重複，不需重新讀取 CSV"""
+    try:
+        if 'order_sn' not in table.column_names:
+            LOGGER.warning("⚠️ 資料表中沒有 order_sn 欄位")
+            return None
+
+        # 向量化計數每個 order_sn 出現次數，只取出現超過一次者
+        value_counts = pc.value_counts(table.column('order_sn'))
+        duplicate_sns = value_counts.field('values').filter(pc.greater(value_counts.field('counts'), 1)).to_pylist()
+
+        if duplicate_sns:
+            LOGGER.warning("⚠️ 發現 %s 個重複的 order_sn", len(duplicate_sns))
+            return duplicate_sns
+        else:
+            LOGGER.info("✅ 無重複的 order_sn")
+            return None
+
+    except Exception as e:
+        LOGGER.error("❌ 檢查重複時發生錯誤: %s", e)
+        return None
+
+
+def check_duplicate_order_sn_streaming(csv_path: str, block_size: int = CSV_STREAM_BLOCK_SIZE) -> Optional[List[str]]:
+    """以串流方式分批讀取 CSV 的 order_sn 檢查重複，記憶體只與不重複的鍵數量成正比"""
+    try:
+        if 'order_sn' not in pacsv.open_csv(csv_path).schema.names:
+            LOGGER.warning("⚠️ CSV 檔案中沒有 order_sn 欄位")
+            return None
+
+        reader = pacsv.open_csv(
+            csv_path,
+            read_options=pacsv.ReadOptions(block_size=block_size),
+            convert_options=pacsv.ConvertOptions(
+                include_columns=['order_sn'],
+                column_types={'order_sn': pa.string()},
+            ),
+        )
+        duplicate_sns = find_duplicate_keys(batch.column(0) for batch in reader)
+
+        if duplicate_sns:
+            LOGGER.warning("⚠️ 發現 %s 個重複的 order_sn", len(duplicate_sns))
+            return duplicate_sns
+        else:
+            LOGGER.info("✅ 無重複的 order_sn")
+            return None
+
+    except Exception as e:
+        LOGGER.error("❌ 檢查重複時發生錯誤: %s", e)
         return None
 
 
@@ -173,5 +1110,5 @@ def get_table_info(client: bigquery.Client, dataset_id: str, table_id: str) -> O
         }
         
     except Exception as e:
-        print(f"❌ 取得資料表資訊失敗: {e}")
+        LOGGER.error("❌ 取得資料表資訊失敗: %s", e)
         return None
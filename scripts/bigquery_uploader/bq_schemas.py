@@ -11,6 +11,8 @@ BigQuery 資料表結構定義模組
 已定義的資料表結構：
 - c1105_momo_accounting_orders: Momo 帳務對帳資料表
 - a1102_momo_shipping_orders: Momo 物流對帳資料表
+- SCHEMA_REGISTRY: 資料表名稱對應 Schema 的查詢表
+- MERGE_KEY_REGISTRY: 資料表名稱對應 MERGE 去重鍵的查詢表
 
 Authors: 楊翔志 & AI Collective
 Studio: tranquility-base
@@ -225,3 +227,20 @@ pchome_orders_data_schema = [
     bigquery.SchemaField("remark", "STRING"),
     bigquery.SchemaField("processing_date", "TIMESTAMP"),
 ]
+
+# 資料表名稱 -> Schema 對照表
+# 於模組載入時建立一次，供上傳器直接查詢；以 tuple 保存避免多執行緒共用時被修改。
+SCHEMA_REGISTRY: dict[str, tuple[bigquery.SchemaField, ...]] = {
+    "c1105_momo_accounting_orders": tuple(c1105_momo_accounting_orders_schema),
+    "a1102_momo_shipping_orders": tuple(a1102_momo_shipping_orders_schema),
+    "etmall_orders": tuple(etmall_orders_schema),
+}
+
+# 資料表名稱 -> MERGE 去重鍵對照表
+# --merge 時依此欄位判斷同一筆資料；etmall_orders 每列為一個訂單明細，需以 order_line_uid 區分，
+# 若以 order_sn 去重會只保留每張訂單的一個明細。
+MERGE_KEY_REGISTRY: dict[str, str] = {
+    "c1105_momo_accounting_orders": "order_sn",
+    "a1102_momo_shipping_orders": "order_sn",
+    "etmall_orders": "order_line_uid",
+}
@@ -8,10 +8,13 @@ ETMall BigQuery 上傳器
 - 自動抓取最新的 ETMall 產品資料豐富化 CSV 檔案 (etmall_orders_product_enriched_*.csv)
 - 從 data_processed/merged 目錄讀取腳本 10 的輸出檔案
 - 上傳到 shopee-etl-reporting.yichai_etmall_data.etmall_orders_data
-- 自動重複資料檢查與處理
-- 完整的日誌記錄與錯誤追蹤
+- 自動重複資料檢查與處理（上傳前依 order_line_uid 去除重複列，保留最後一筆）
+- 完整的日誌記錄與錯誤追蹤（輪替日誌檔 logs/etmall_to_bigquery_uploader.log）
 - 支援多種上傳模式 (WRITE_TRUNCATE/APPEND/EMPTY)，預設為覆蓋模式
 - 根據 etmall_fields_mapping.json 動態生成 schema
+- 支援經 GCS 暫存桶載入 (--staging_bucket)
+- 支援以 Storage Write API 追加寫入 (--use_storage_write)
+- 支援大型檔案串流分批上傳 (--stream)
 
 Authors: 楊翔志 & AI Collective
 Studio: tranquility-base
@@ -21,16 +24,24 @@ import argparse
 import os
 import sys
 import pandas as pd
+import pyarrow as pa
 import logging
-import glob
 import json
-from datetime import datetime
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
 
 # ✅ 將專案根目錄加入 sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
 # ✅ 使用相對 import
-from bigquery_utils import get_bq_client, upload_csv_to_bq, check_duplicate_order_sn
+from bigquery_utils import (
+    get_bq_client, get_bq_credentials, find_latest_file, read_csv_header, read_csv_as_arrow,
+    upload_arrow_table_to_bq, upload_arrow_table_in_shards, upload_arrow_table_by_partition,
+    upload_arrow_table_via_write_api,
+    upload_csv_stream_to_bq, drop_duplicate_keys, check_duplicate_order_sn_table,
+    check_duplicate_order_sn_streaming
+)
 from google.cloud import bigquery
 
 # ETMall 專用設定
@@ -38,178 +49,169 @@ ETMALL_DATASET = "yichai_etmall_data"
 ETMALL_TABLE = "etmall_orders_data"
 ETMALL_PROJECT = "shopee-etl-reporting"
 
+# 讀取 CSV 時視為空值的字串
+NULL_TOKENS = ['', 'nan', 'None', 'NULL', 'NaN', 'NAN', 'null', 'Null']
+
+# 訂單明細唯一鍵（order_sn + item_no）；同一 order_sn 可有多筆明細，去重需以此為準
+DEDUP_KEY = 'order_line_uid'
+
+# 專案根目錄（本檔案往上兩層），路徑不受執行時的工作目錄影響
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+# 日誌檔案（固定檔名，超過大小後輪替，保留最近 10 份）
+LOG_PATH = PROJECT_ROOT / "logs" / "etmall_to_bigquery_uploader.log"
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_COUNT = 10
+
+@lru_cache(maxsize=None)
 def get_csv_pattern():
-    """根據當前工作目錄動態設定 CSV 檔案路徑
+    """CSV 檔案路徑模式
     
     現在讀取 data_processed/merged 目錄下的腳本 10 輸出檔案
     """
-    current_dir = os.getcwd()
-    
-    # 如果當前目錄是專案根目錄
-    if os.path.basename(current_dir) == "ec-data-pipeline":
-        return "data_processed/merged/etmall_orders_product_enriched_*.csv"
-    # 如果當前目錄是 scripts/bigquery_uploader
-    elif os.path.basename(current_dir) == "bigquery_uploader":
-        return "../../data_processed/merged/etmall_orders_product_enriched_*.csv"
-    # 其他情況，嘗試相對路徑
-    else:
-        return "../../data_processed/merged/etmall_orders_product_enriched_*.csv"
+    return str(PROJECT_ROOT / "data_processed" / "merged" / "etmall_orders_product_enriched_*.csv")
 
+@lru_cache(maxsize=None)
 def get_credential_path():
-    """根據當前工作目錄動態設定認證檔案路徑"""
-    current_dir = os.getcwd()
-    
-    # 如果當前目錄是專案根目錄
-    if os.path.basename(current_dir) == "ec-data-pipeline":
-        return "config/bigquery_uploader_key.json"
-    # 如果當前目錄是 scripts/bigquery_uploader
-    elif os.path.basename(current_dir) == "bigquery_uploader":
-        return "../../config/bigquery_uploader_key.json"
-    # 其他情況，嘗試相對路徑
-    else:
-        return "../../config/bigquery_uploader_key.json"
+    """認證檔案路徑"""
+    return str(PROJECT_ROOT / "config" / "bigquery_uploader_key.json")
 
+@lru_cache(maxsize=None)
 def get_mapping_path():
-    """根據當前工作目錄動態設定欄位映射檔案路徑"""
-    current_dir = os.getcwd()
-    
-    # 如果當前目錄是專案根目錄
-    if os.path.basename(current_dir) == "ec-data-pipeline":
-        return "config/etmall_fields_mapping.json"
-    # 如果當前目錄是 scripts/bigquery_uploader
-    elif os.path.basename(current_dir) == "bigquery_uploader":
-        return "../../config/etmall_fields_mapping.json"
-    # 其他情況，嘗試相對路徑
-    else:
-        return "../../config/etmall_fields_mapping.json"
+    """欄位映射檔案路徑"""
+    return str(PROJECT_ROOT / "config" / "etmall_fields_mapping.json")
 
 def load_field_mapping():
-    """載入欄位映射配置"""
+    """載入欄位映射配置
+    
+    依檔案修改時間快取解析結果，檔案未變更時同一行程內不重複解析 JSON；
+    回傳的 dict 為共用快取，請勿修改。
+    """
     mapping_path = get_mapping_path()
     try:
-        with open(mapping_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return _load_json(mapping_path, os.stat(mapping_path).st_mtime_ns)
     except FileNotFoundError:
         raise FileNotFoundError(f"找不到欄位映射檔案：{mapping_path}")
     except json.JSONDecodeError as e:
         raise ValueError(f"欄位映射檔案格式錯誤：{e}")
 
-def generate_schema_from_csv_columns(csv_columns: list[str]) -> list[bigquery.SchemaField]:
-    """根據實際CSV欄位生成 BigQuery Schema，根據欄位類型設定適當的資料型態"""
-    schema: list[bigquery.SchemaField] = []
+@lru_cache(maxsize=4)
+def _load_json(path: str, mtime_ns: int) -> dict:
+    """讀取 JSON 檔案（以路徑與修改時間為快取鍵，檔案更新後自動重新讀取）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# 欄位類型映射（未列出的欄位一律為 STRING）
+ETMALL_FIELD_TYPES = {
+    # 日期類型
+    'order_date': 'DATE',
+    'order_time': 'TIME',
+    'created_at': 'DATETIME',
+    'updated_at': 'DATETIME',
+    'processing_date': 'TIMESTAMP',
     
-    # 定義欄位類型映射
-    field_type_mapping = {
-        # 日期類型
-        'order_date': 'DATE',
-        'order_time': 'TIME',
-        'created_at': 'DATETIME',
-        'updated_at': 'DATETIME',
-        
-        # 數字類型
-        'quantity': 'INTEGER',
-        'product_spec': 'FLOAT',
-        'product_weight_g': 'FLOAT',
-        
-        # 新台幣金額類型
-        'unit_price': 'NUMERIC',
-        'order_amount': 'NUMERIC',
-        'platform_reconciliation_cost': 'NUMERIC',
-        'supplier_cost': 'NUMERIC',
-        'product_msrp': 'NUMERIC',
-        'product_cost': 'NUMERIC',
-        'total_amount': 'NUMERIC',
-        'discount_amount': 'NUMERIC',
-        
-        # 布林值類型
-        'is_gift': 'BOOLEAN',
-        'shop_shop_status': 'BOOLEAN',
-        'shop_is_shopee_ad_delivery_enabled': 'BOOLEAN',
-        'shop_status': 'BOOLEAN',
-        'is_shopee_ad_delivery_enabled': 'BOOLEAN',
-        
-        # 新增的產品相關欄位
-        'category_level_1': 'STRING',
-        'category_level_2': 'STRING',
-        'brand': 'STRING',
-        'series': 'STRING',
-        'pet_type': 'STRING',
-        'product_name': 'STRING',
-        'item_code': 'STRING',
-        'sku': 'STRING',
-        'tags': 'STRING',
-        'spec': 'STRING',
-        'unit': 'STRING',
-        'origin': 'STRING',
-        'supplier_code': 'STRING',
-        'supplier': 'STRING',
-        
-        # 新增的商店相關欄位
-        'shop_name': 'STRING',
-        'shop_business_model': 'STRING',
-        'location': 'STRING',
-        'phone': 'STRING',
-        'department': 'STRING',
-        'manager': 'STRING',
-        
-        # 其他欄位保持為字串
-        'default': 'STRING'
-    }
+    # 數字類型
+    'quantity': 'INTEGER',
+    'product_spec': 'FLOAT',
+    'product_weight_g': 'FLOAT',
     
-    # 為每個實際存在的欄位生成 Schema
-    for column_name in csv_columns:
-        # 根據欄位名稱決定資料類型
-        if column_name in field_type_mapping:
-            field_type = field_type_mapping[column_name]
-        else:
-            field_type = 'STRING'
-        
-        schema.append(bigquery.SchemaField(column_name, field_type, mode="NULLABLE"))
+    # 新台幣金額類型
+    'unit_price': 'NUMERIC',
+    'order_amount': 'NUMERIC',
+    'platform_reconciliation_cost': 'NUMERIC',
+    'supplier_cost': 'NUMERIC',
+    'product_msrp': 'NUMERIC',
+    'product_cost': 'NUMERIC',
+    'total_amount': 'NUMERIC',
+    'discount_amount': 'NUMERIC',
+    
+    # 布林值類型
+    'is_gift': 'BOOLEAN',
+    'shop_shop_status': 'BOOLEAN',
+    'shop_is_shopee_ad_delivery_enabled': 'BOOLEAN',
+    'shop_status': 'BOOLEAN',
+    'is_shopee_ad_delivery_enabled': 'BOOLEAN',
+    
+    # 新增的產品相關欄位
+    'category_level_1': 'STRING',
+    'category_level_2': 'STRING',
+    'brand': 'STRING',
+    'series': 'STRING',
+    'pet_type': 'STRING',
+    'product_name': 'STRING',
+    'item_code': 'STRING',
+    'sku': 'STRING',
+    'tags': 'STRING',
+    'spec': 'STRING',
+    'unit': 'STRING',
+    'origin': 'STRING',
+    'supplier_code': 'STRING',
+    'supplier': 'STRING',
+    
+    # 新增的商店相關欄位
+    'shop_name': 'STRING',
+    'shop_business_model': 'STRING',
+    'location': 'STRING',
+    'phone': 'STRING',
+    'department': 'STRING',
+    'manager': 'STRING',
+}
+
+def generate_schema_from_csv_columns(csv_columns: list[str]) -> list[bigquery.SchemaField]:
+    """根據實際CSV欄位生成 BigQuery Schema，根據欄位類型設定適當的資料型態
     
-    return schema
+    相同欄位組合的 Schema 只建立一次，之後直接重複使用。
+    """
+    return list(_build_schema(tuple(csv_columns)))
+
+@lru_cache(maxsize=8)
+def _build_schema(csv_columns: tuple[str, ...]) -> tuple[bigquery.SchemaField, ...]:
+    """為每個實際存在的欄位生成 Schema（未列於 ETMALL_FIELD_TYPES 的欄位為 STRING）"""
+    schema_field = bigquery.SchemaField
+    field_type = ETMALL_FIELD_TYPES.get
+    return tuple([
+        schema_field(column_name, field_type(column_name, 'STRING'), mode="NULLABLE")
+        for column_name in csv_columns
+    ])
 
 def find_latest_etmall_csv():
     """自動抓取最新的 ETMall 產品資料豐富化 CSV 檔案（腳本 10 輸出）"""
-    csv_files = glob.glob(get_csv_pattern())
-    if not csv_files:
-        raise FileNotFoundError(f"找不到符合模式的 CSV 檔案：{get_csv_pattern()}")
-    
-    # 標準化路徑並按檔案修改時間排序，取最新的
-    csv_files = [os.path.normpath(f) for f in csv_files]
-    latest_file = max(csv_files, key=os.path.getmtime)
-    return latest_file
+    pattern = get_csv_pattern()
+    latest_file = find_latest_file(*os.path.split(pattern))
+    if latest_file is None:
+        raise FileNotFoundError(f"找不到符合模式的 CSV 檔案：{pattern}")
+    return os.path.normpath(latest_file)
 
 def setup_logging():
-    """設定日誌"""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_filename = f"logs/etmall_to_bigquery_uploader_{timestamp}.log"
-    
-    # 確保 logs 目錄存在
-    os.makedirs("logs", exist_ok=True)
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_filename, encoding='utf-8'),
+    """設定日誌（輪替檔案，同一行程只初始化一次）"""
+    root_logger = logging.getLogger()
+    if not any(isinstance(handler, RotatingFileHandler) for handler in root_logger.handlers):
+        # 確保 logs 目錄存在
+        LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        for handler in (
+            RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'),
             logging.StreamHandler()
-        ]
-    )
+        ):
+            handler.setFormatter(formatter)
+            root_logger.addHandler(handler)
+        root_logger.setLevel(logging.INFO)
     return logging.getLogger(__name__)
 
-def validate_csv_columns(df: pd.DataFrame, field_mapping: dict[str, dict[str, str]]) -> bool:
+def validate_csv_columns(columns: list[str], field_mapping: dict[str, dict[str, str]]) -> bool:
     """驗證 CSV 檔案的欄位是否符合映射配置"""
-    csv_columns = set(df.columns)
-    mapping_columns = set(field_mapping.keys())
+    csv_columns = set(columns)
     
-    missing_columns = mapping_columns - csv_columns
-    extra_columns = csv_columns - mapping_columns
+    # dict 的 keys view 可直接做集合運算，不需另建映射欄位的 set；排序後輸出，日誌內容穩定
+    missing_columns = sorted(field_mapping.keys() - csv_columns)
+    extra_columns = sorted(csv_columns.difference(field_mapping))
     
     if missing_columns:
-        logging.warning(f"CSV 檔案缺少以下欄位：{missing_columns}")
+        logging.warning("CSV 檔案缺少以下欄位：%s", missing_columns)
     
     if extra_columns:
-        logging.info(f"CSV 檔案包含額外欄位：{extra_columns}")
+        logging.info("CSV 檔案包含額外欄位：%s", extra_columns)
     
     return len(missing_columns) == 0
 
@@ -229,6 +231,20 @@ def main():
                        help="檢查 order_sn 重複")
     parser.add_argument("--no_check_duplicates", action="store_true",
                        help="跳過重複檢查")
+    parser.add_argument("--keep_duplicates", action="store_true",
+                       help=f"上傳前不依 {DEDUP_KEY} 去除重複列")
+    parser.add_argument("--shard_rows", type=int,
+                       help="大型檔案分片平行上傳，每片筆數（不指定則單一載入作業）")
+    parser.add_argument("--by_partition", action="store_true",
+                       help="依目標資料表的時間分區平行載入（WRITE_TRUNCATE 只覆蓋資料中出現的分區；優先於 --shard_rows）")
+    parser.add_argument("--staging_bucket",
+                       help="GCS 暫存桶名稱（指定時先上傳至 GCS 再由 BigQuery 載入）")
+    parser.add_argument("--use_storage_write", action="store_true",
+                       help="改用 BigQuery Storage Write API 追加寫入（需搭配 WRITE_APPEND；選用功能，需另行安裝 google-cloud-bigquery-storage）")
+    parser.add_argument("--schema_only", action="store_true",
+                       help="只讀取 CSV 標題列並輸出 BigQuery Schema，不讀取資料列、不上傳")
+    parser.add_argument("--stream", action="store_true",
+                       help="大型檔案以串流分批讀取並上傳，不整份讀入記憶體（優先於 --shard_rows、--use_storage_write）")
     
     args = parser.parse_args()
     
@@ -237,6 +253,10 @@ def main():
     logger.info("=== ETMall 訂單資料上傳至 BigQuery ===")
     logger.info(f"目標資料表：{args.project}.{args.dataset}.{args.table}")
     
+    if args.use_storage_write and args.write_disposition != "WRITE_APPEND":
+        logger.error("❌ Storage Write API 只支援追加寫入，請搭配 --write_disposition WRITE_APPEND")
+        return 1
+    
     # 載入欄位映射（用於驗證）
     try:
         field_mapping = load_field_mapping()
@@ -262,124 +282,133 @@ def main():
         logger.error(f"❌ CSV 檔案不存在：{csv_path}")
         return 1
     
+    if args.schema_only:
+        # 只讀標題列生成 Schema，不建立 BigQuery 客戶端
+        csv_columns = read_csv_header(csv_path)
+        columns = [col for col in csv_columns if col != 'processing_date'] + ['processing_date']
+        schema = generate_schema_from_csv_columns(columns)
+        validate_csv_columns(csv_columns, field_mapping)
+        logger.info("=== Schema（%s 個欄位）===", len(schema))
+        for field in schema:
+            logger.info("  %s: %s", field.name, field.field_type)
+        return 0
+    
     # 檢查重複設定
     check_duplicates = args.check_duplicates and not args.no_check_duplicates
     
     try:
         # 建立 BigQuery 客戶端
         client = get_bq_client(args.credential)
+        credentials = get_bq_credentials(args.credential)
         logger.info("✅ BigQuery 客戶端建立成功")
         
-        # 讀取 CSV 檔案，設定 keep_default_na=False 避免自動識別 NaN
-        logger.info("📖 讀取 CSV 檔案...")
-        df = pd.read_csv(csv_path, dtype=str, keep_default_na=False, na_values=[], na_filter=False)
-        logger.info(f"✅ CSV 檔案讀取成功，共 {len(df)} 筆資料")
+        # 只讀標題列，依欄位名稱先生成 Schema（processing_date 於讀取後補上）
+        csv_columns = read_csv_header(csv_path)
+        columns = [col for col in csv_columns if col != 'processing_date'] + ['processing_date']
+        schema = generate_schema_from_csv_columns(columns)
+        logger.info(f"✅ 已生成 BigQuery Schema，包含 {len(schema)} 個欄位")
         
         # 驗證欄位
-        if not validate_csv_columns(df, field_mapping):
+        if not validate_csv_columns(csv_columns, field_mapping):
             logger.warning("⚠️ CSV 檔案欄位與映射配置不完全匹配")
         
-        # 檢查重複資料
-        if check_duplicates:
-            logger.info("🔍 檢查重複資料...")
-            duplicate_sns = check_duplicate_order_sn(df)
-            if duplicate_sns:
-                logger.info(f"發現 {len(duplicate_sns)} 個重複的 order_sn")
-            else:
-                logger.info("無重複的 order_sn")
-        
-        # 為 CSV 檔案添加 processing_date 欄位
-        logger.info("📝 為 CSV 檔案添加 processing_date 欄位...")
-        df['processing_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        # 處理空值：將所有 nan、None、NULL 等值轉換為空字串
-        logger.info("🔧 處理空值，將 nan、None、NULL 轉換為空字串...")
+        processing_date = pa.scalar(pd.Timestamp.now(tz='Asia/Taipei'), pa.timestamp('us', tz='UTC'))
         
-        # 先處理 DataFrame 中的空值
-        df = df.replace(['nan', 'None', 'NULL', 'NaN', 'NAN', 'null', 'Null'], '')
-        
-        # 確保所有欄位都是字串類型
-        for col in df.columns:
-            df[col] = df[col].astype(str)
-            # 再次處理，確保轉換後的字串中沒有 'nan' 相關值
-            df[col] = df[col].replace(['nan', 'None', 'NULL', 'NaN', 'NAN', 'null', 'Null'], '')
-        
-        # 檢查是否還有遺漏的空值
-        empty_count = 0
-        for col in df.columns:
-            empty_count += (df[col] == 'nan').sum()
-            empty_count += (df[col] == 'None').sum()
-            empty_count += (df[col] == 'NULL').sum()
-        
-        if empty_count > 0:
-            logger.warning(f"⚠️ 仍有 {empty_count} 個空值需要處理")
+        if args.stream:
+            # 串流模式：分批讀取並寫入 Parquet 暫存檔，峰值記憶體只與批次大小成正比
+            if check_duplicates:
+                logger.info("🔍 以串流方式檢查重複資料...")
+                check_duplicate_order_sn_streaming(csv_path)
+            logger.info(f"ℹ️ 串流模式不去除 {DEDUP_KEY} 重複列")
+            
+            logger.info(f"📤 開始串流上傳資料...")
+            logger.info(f"模式：{args.write_disposition}")
+            result = upload_csv_stream_to_bq(
+                client, csv_path, args.dataset, args.table, schema,
+                write_disposition=args.write_disposition,
+                logger=logger,
+                staging_bucket=args.staging_bucket,
+                credentials=credentials,
+                null_values=NULL_TOKENS,
+                constant_columns={'processing_date': processing_date}
+            )
         else:
-            logger.info("✅ 所有空值已正確處理")
+            # 依 Schema 型態以 pyarrow 直接讀成具型態的欄位，nan、None、NULL 等字串於解析時即視為空值
+            logger.info("📖 讀取 CSV 檔案...")
+            table = read_csv_as_arrow(csv_path, schema[:-1], null_values=NULL_TOKENS)
+            logger.info(f"✅ CSV 檔案讀取成功，共 {table.num_rows} 筆資料")
         
-        # 檢查欄位數量
-        logger.info(f"添加 processing_date 後，DataFrame 有 {len(df.columns)} 個欄位")
-        logger.info(f"前5個欄位：{list(df.columns[:5])}")
-        logger.info(f"後5個欄位：{list(df.columns[-5:])}")
+            # 檢查重複資料
+            if check_duplicates:
+                logger.info("🔍 檢查重複資料...")
+                duplicate_sns = check_duplicate_order_sn_table(table)
+                if duplicate_sns:
+                    logger.info(f"發現 {len(duplicate_sns)} 個重複的 order_sn")
+                else:
+                    logger.info("無重複的 order_sn")
         
-        # 創建臨時檔案
-        temp_csv_path = csv_path.replace('.csv', '_with_processing_date.csv')
+            # 依訂單明細鍵去除重複列，保留最後一筆（與 ETL 步驟 06 的去重規則一致）
+            if not args.keep_duplicates and DEDUP_KEY in table.column_names:
+                row_count = table.num_rows
+                table = drop_duplicate_keys(table, DEDUP_KEY)
+                if table.num_rows < row_count:
+                    logger.info(f"🧹 依 {DEDUP_KEY} 去除 {row_count - table.num_rows} 筆重複資料")
         
-        # 保存前再次檢查欄位數量
-        logger.info(f"保存前，DataFrame 有 {len(df.columns)} 個欄位")
+            # 添加 processing_date 欄位（單一時間點，不逐列產生字串）
+            logger.info("📝 添加 processing_date 欄位...")
+            table = table.append_column(
+                'processing_date',
+                pa.repeat(processing_date, table.num_rows)
+            )
         
-        # 使用更安全的方式保存 CSV，確保空值處理
-        try:
-            df.to_csv(temp_csv_path, index=False, encoding='utf-8-sig', na_rep='')
-            logger.info(f"✅ 已創建臨時檔案：{temp_csv_path}")
-        except Exception as e:
-            logger.error(f"創建臨時檔案失敗：{e}")
-            return 1
+            # 檢查欄位數量
+            logger.info("添加 processing_date 後，資料表有 %s 個欄位", table.num_columns)
+            logger.info("前5個欄位：%s", table.column_names[:5])
+            logger.info("後5個欄位：%s", table.column_names[-5:])
         
-        # 驗證臨時檔案
-        try:
-            temp_df = pd.read_csv(temp_csv_path, encoding='utf-8-sig')
-            logger.info(f"臨時檔案驗證：{len(temp_df.columns)} 個欄位，{len(temp_df)} 行資料")
-            logger.info(f"臨時檔案前5個欄位：{list(temp_df.columns[:5])}")
-            logger.info(f"臨時檔案後5個欄位：{list(temp_df.columns[-5:])}")
-            
-            # 檢查 processing_date 欄位是否存在
-            if 'processing_date' in temp_df.columns:
-                logger.info("✅ processing_date 欄位已正確添加")
-            else:
-                logger.error("❌ processing_date 欄位遺失")
-                return 1
-                
-            # 根據實際欄位生成 Schema
-            schema = generate_schema_from_csv_columns(list(temp_df.columns))
-            logger.info(f"✅ 已生成 BigQuery Schema，包含 {len(schema)} 個欄位")
-            
-            # 顯示 Schema 詳情
-            logger.info("📋 BigQuery Schema 詳情：")
-            for field in schema:
-                logger.info(f"  - {field.name}: {field.field_type} ({field.mode})")
-                
-        except Exception as e:
-            logger.error(f"臨時檔案驗證失敗：{e}")
-            return 1
-        
-        # 上傳資料
-        logger.info(f"📤 開始上傳資料...")
-        logger.info(f"檔案：{temp_csv_path}")
-        logger.info(f"模式：{args.write_disposition}")
+            # Schema 詳情每欄一行，只在 DEBUG 層級輸出
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("📋 BigQuery Schema 詳情：\n%s", "\n".join(
+                    f"  - {field.name}: {field.field_type} ({field.mode})" for field in schema
+                ))
         
-        result = upload_csv_to_bq(
-            client=client,
-            csv_path=temp_csv_path,
-            dataset_id=args.dataset,
-            table_id=args.table,
-            schema=schema,
-            write_disposition=args.write_disposition
-        )
+            # 上傳資料：Arrow 資料表以 Parquet 直接上傳，不寫出暫存 CSV
+            logger.info(f"📤 開始上傳資料...")
+            logger.info(f"模式：{args.write_disposition}")
+            if args.staging_bucket:
+                logger.info(f"經 GCS 暫存桶載入：{args.staging_bucket}")
         
-        # 清理臨時檔案
-        if os.path.exists(temp_csv_path):
-            os.remove(temp_csv_path)
-            logger.info("🧹 已清理臨時檔案")
+            if args.use_storage_write:
+                result = upload_arrow_table_via_write_api(
+                    client, table, args.dataset, args.table, schema,
+                    logger=logger,
+                    write_disposition=args.write_disposition,
+                    credentials=credentials
+                )
+            elif args.by_partition:
+                result = upload_arrow_table_by_partition(
+                    client, table, args.dataset, args.table, schema,
+                    write_disposition=args.write_disposition,
+                    logger=logger,
+                    staging_bucket=args.staging_bucket,
+                    credentials=credentials
+                )
+            elif args.shard_rows:
+                result = upload_arrow_table_in_shards(
+                    client, table, args.dataset, args.table, schema, args.shard_rows,
+                    write_disposition=args.write_disposition,
+                    logger=logger,
+                    staging_bucket=args.staging_bucket,
+                    credentials=credentials
+                )
+            else:
+                result = upload_arrow_table_to_bq(
+                    client, table, args.dataset, args.table, schema,
+                    write_disposition=args.write_disposition,
+                    logger=logger,
+                    staging_bucket=args.staging_bucket,
+                    credentials=credentials
+                )
         
         if result:
             logger.info("✅ 資料上傳成功！")
@@ -22,15 +22,16 @@ import os
 import sys
 import pandas as pd
 import logging
-import glob
 import json
 from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
 
 # ✅ 將專案根目錄加入 sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
 # ✅ 使用相對 import
-from bigquery_utils import get_bq_client, upload_csv_to_bq, check_duplicate_order_sn
+from bigquery_utils import get_bq_client, get_bq_credentials, find_latest_file, read_csv_header, read_csv_as_strings, upload_dataframe_to_bq, check_duplicate_order_sn
 from google.cloud import bigquery
 
 # MOMO 會計訂單專用設定
@@ -38,35 +39,63 @@ MOMO_DATASET = "yichai_momo_data"
 MOMO_TABLE = "c1105_momo_accounting_orders"
 MOMO_PROJECT = "shopee-etl-reporting"
 
+# 欄位類型映射（未列出的欄位一律為 STRING）
+# product_manufacturer_code、product_sku_main、product_barcode、product_spec 必須保持字串格式，避免小數點
+MOMO_FIELD_TYPES = {
+    # 數字類型
+    'quantity': bigquery.SqlTypeNames.FLOAT,
+    'product_cost_untaxed': bigquery.SqlTypeNames.FLOAT,
+    'platform_product_cost': bigquery.SqlTypeNames.FLOAT,
+    'product_original_price': bigquery.SqlTypeNames.FLOAT,
+    'product_cost_from_catalog': bigquery.SqlTypeNames.FLOAT,
+    'product_weight_g': bigquery.SqlTypeNames.FLOAT,
+    'product_min_qty': bigquery.SqlTypeNames.FLOAT,
+    'product_msrp': bigquery.SqlTypeNames.FLOAT,
+    'product_price': bigquery.SqlTypeNames.FLOAT,
+    'product_supplier_price': bigquery.SqlTypeNames.FLOAT,
+    'product_list_price': bigquery.SqlTypeNames.FLOAT,
+    'single_product_id': bigquery.SqlTypeNames.FLOAT,
+    
+    # 布林值類型
+    'is_abnormal_order': bigquery.SqlTypeNames.BOOLEAN,
+    'shop_is_ad_shopee_ads_enabled': bigquery.SqlTypeNames.BOOLEAN,
+    
+    # 日期類型
+    'order_date': bigquery.SqlTypeNames.DATE,
+    'actual_shipping_date': bigquery.SqlTypeNames.DATE,
+    'ship_by_date': bigquery.SqlTypeNames.DATE,
+    'product_price_date': bigquery.SqlTypeNames.DATE,
+    'order_transfer_date': bigquery.SqlTypeNames.DATETIME,
+    'bq_processing_timestamp': bigquery.SqlTypeNames.DATETIME,
+}
+
+# 專案根目錄（本檔案往上兩層），路徑不受執行時的工作目錄影響
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+@lru_cache(maxsize=None)
 def get_csv_pattern():
-    """根據當前工作目錄動態設定 CSV 檔案路徑
+    """CSV 檔案路徑模式
     
     現在讀取 data_processed/merged 目錄下的腳本 06 輸出檔案
     """
-    current_dir = os.getcwd()
-    
-    # 如果當前目錄是專案根目錄
-    if os.path.basename(current_dir) == "ec-data-pipeline":
-        return "data_processed/merged/momo_accounting_orders_bq_formatted_*.csv"
-    
-    # 如果當前目錄是 scripts/bigquery_uploader
-    elif os.path.basename(current_dir) == "bigquery_uploader":
-        return "../../data_processed/merged/momo_accounting_orders_bq_formatted_*.csv"
-    
-    # 其他情況，嘗試相對路徑
-    else:
-        return "data_processed/merged/momo_accounting_orders_bq_formatted_*.csv"
+    return str(PROJECT_ROOT / "data_processed" / "merged" / "momo_accounting_orders_bq_formatted_*.csv")
+
+@lru_cache(maxsize=None)
+def get_credential_path():
+    """認證檔案路徑"""
+    return str(PROJECT_ROOT / "config" / "bigquery_uploader_key.json")
+
+@lru_cache(maxsize=None)
+def get_mapping_path():
+    """欄位映射檔案路徑"""
+    return str(PROJECT_ROOT / "config" / "c1105_momo_fields_mapping.json")
 
 def get_latest_csv_file():
     """自動找最新的 MOMO 會計訂單 BigQuery 格式 CSV 檔案"""
     pattern = get_csv_pattern()
-    csv_files = glob.glob(pattern)
-    
-    if not csv_files:
+    latest_file = find_latest_file(*os.path.split(pattern))
+    if latest_file is None:
         raise FileNotFoundError(f"找不到符合模式的檔案: {pattern}")
-    
-    # 按修改時間排序，取最新的
-    latest_file = max(csv_files, key=os.path.getmtime)
     return latest_file
 
 def setup_logging():
@@ -93,57 +122,49 @@ def setup_logging():
     return logging.getLogger(__name__)
 
 def load_field_mapping():
-    """載入 C1105 MOMO 欄位對應設定"""
-    current_dir = os.getcwd()
+    """載入 C1105 MOMO 欄位對應設定
     
-    # 根據當前目錄設定配置檔案路徑
-    if os.path.basename(current_dir) == "bigquery_uploader":
-        mapping_path = "../../config/c1105_momo_fields_mapping.json"
-    else:
-        mapping_path = "config/c1105_momo_fields_mapping.json"
+    依檔案修改時間快取解析結果，檔案未變更時同一行程內不重複解析 JSON；
+    回傳的 dict 為共用快取，請勿修改。
+    """
+    mapping_path = get_mapping_path()
     
     if not os.path.exists(mapping_path):
         raise FileNotFoundError(f"找不到欄位對應檔案: {mapping_path}")
     
-    with open(mapping_path, 'r', encoding='utf-8') as f:
-        mapping = json.load(f)
-    
-    return mapping
+    return _load_json(mapping_path, os.stat(mapping_path).st_mtime_ns)
 
-def clean_csv_duplicate_columns(csv_path, logger):
-    """清理CSV檔案中的重複欄位和無效字元"""
-    logger.info("檢查並清理重複欄位和無效字元...")
-    
-    # 讀取CSV檔案（確保特定欄位保持字串格式）
-    df = pd.read_csv(csv_path)
-    
-    # 強制將特定欄位轉換為字串，避免小數點
-    string_fields = ['product_manufacturer_code', 'product_sku_main', 'product_barcode', 'product_spec']
-    for field in string_fields:
-        if field in df.columns:
-            # 先轉換為整數（如果是數值），再轉換為字串
-            if df[field].dtype in ['int64', 'float64']:
-                # 使用 apply 方法確保每個值都被正確轉換
-                df[field] = df[field].apply(lambda x: str(int(float(x))) if pd.notna(x) else '')
-            else:
-                df[field] = df[field].astype(str)
-            # 強制轉換為字串類型
-            df[field] = df[field].astype(str)
-    
-    # 處理帳務數字欄位，確保小數點下兩位
-    cost_fields = ['product_cost_untaxed', 'platform_product_cost', 'product_original_price', 'product_cost_from_catalog']
-    for field in cost_fields:
-        if field in df.columns:
-            # 轉換為數值，保留小數點下兩位
-            df[field] = pd.to_numeric(df[field], errors='coerce').round(2).fillna(0)
-            # 確保顯示小數點下兩位（包括整數也要顯示.00）
-            df[field] = df[field].apply(lambda x: f"{x:.2f}" if pd.notna(x) else "0.00")
+@lru_cache(maxsize=4)
+def _load_json(path, mtime_ns):
+    """讀取 JSON 檔案（以路徑與修改時間為快取鍵，檔案更新後自動重新讀取）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def to_int_string(s):
+    """整欄皆為數值（或空白）時轉為整數字串（截去小數），空值為空字串；否則原樣回傳
     
-    # 清理欄位名稱
-    original_columns = df.columns.tolist()
+    輸入為 read_csv_as_strings 讀入的字串欄位，一次轉換即為最終字串格式，不需再 astype(str)。
+    """
+    numbers = pd.to_numeric(s, errors='coerce')
+    if not (numbers.notna() | (s == '')).all():
+        return s
+    return numbers.dropna().astype('int64').astype(str).reindex(s.index, fill_value='')
+
+def mangle_duplicate_columns(columns):
+    """重複的欄位名稱依 pandas 慣例加上 .1、.2 後綴"""
+    column_counts = {}
+    mangled_columns = []
+    for col in columns:
+        count = column_counts.get(col, 0)
+        mangled_columns.append(f"{col}.{count}" if count else col)
+        column_counts[col] = count + 1
+    return mangled_columns
+
+def clean_column_names(columns, logger):
+    """將欄位名稱轉為 BigQuery 合法名稱，並為清理後重複的名稱加上後綴"""
     cleaned_columns = []
     
-    for col in original_columns:
+    for col in columns:
         # 替換點號為底線（BigQuery不允許點號）
         cleaned_col = col.replace('.', '_')
         # 替換其他無效字元
@@ -156,74 +177,79 @@ def clean_csv_duplicate_columns(csv_path, logger):
         if col != cleaned_col:
             logger.info(f"欄位名稱清理: {col} -> {cleaned_col}")
     
-    # 重新命名欄位
-    df.columns = cleaned_columns
-    
-    # 檢查是否還有重複欄位
+    # 檢查是否還有重複欄位（記錄每個名稱下一個可用的後綴，避免重複從 1 開始嘗試）
     unique_columns = []
     seen_columns = set()
+    next_suffix = {}
     
     for col in cleaned_columns:
         if col in seen_columns:
             logger.warning(f"發現重複欄位: {col}")
             # 為重複欄位添加後綴
-            counter = 1
+            counter = next_suffix.get(col, 1)
             new_col = f"{col}_{counter}"
             while new_col in seen_columns:
                 counter += 1
                 new_col = f"{col}_{counter}"
-            df = df.rename(columns={col: new_col})
+            next_suffix[col] = counter + 1
             unique_columns.append(new_col)
+            seen_columns.add(new_col)
             logger.info(f"重複欄位重新命名: {col} -> {new_col}")
         else:
             unique_columns.append(col)
             seen_columns.add(col)
     
-    # 重新儲存CSV檔案（確保特定欄位保持字串格式）
-    logger.info(f"清理完成: {len(original_columns)} -> {len(unique_columns)} 個欄位")
-    temp_path = csv_path.replace('.csv', '_cleaned.csv')
-    # 在保存前再次確保特定欄位為字串格式
+    return unique_columns
+
+def clean_csv_duplicate_columns(csv_path, logger):
+    """清理CSV檔案中的重複欄位和無效字元，回傳清理後的 DataFrame（不寫出暫存 CSV）"""
+    logger.info("檢查並清理重複欄位和無效字元...")
+    
+    # 以 pyarrow 多執行緒讀取 CSV，所有欄位保持原始字串，未處理的欄位原樣寫回
+    df = read_csv_as_strings(csv_path).to_pandas()
+    
+    # 重複的欄位名稱依 pandas 慣例加上 .1、.2 後綴，交由下方欄位名稱清理處理
+    df.columns = mangle_duplicate_columns(df.columns)
+    
+    # 強制將特定欄位轉換為字串，避免小數點
+    string_fields = ['product_manufacturer_code', 'product_sku_main', 'product_barcode', 'product_spec']
     for field in string_fields:
         if field in df.columns:
-            df[field] = df[field].astype(str)
+            df[field] = to_int_string(df[field])
     
-    # 在保存前再次確保帳務數字欄位格式正確
+    # 處理帳務數字欄位，確保小數點下兩位
+    cost_fields = ['product_cost_untaxed', 'platform_product_cost', 'product_original_price', 'product_cost_from_catalog']
     for field in cost_fields:
         if field in df.columns:
-            df[field] = df[field].astype(str)
+            # 轉換為數值，保留小數點下兩位
+            df[field] = pd.to_numeric(df[field], errors='coerce').round(2).fillna(0)
+            # 確保顯示小數點下兩位（包括整數也要顯示.00）
+            df[field] = df[field].map('{:.2f}'.format)
     
-    df.to_csv(temp_path, index=False, encoding='utf-8')
-    return temp_path
-
-def generate_bigquery_schema_from_csv(csv_path):
-    """根據 CSV 檔案實際欄位生成 BigQuery schema"""
-    # 讀取 CSV 檔案的第一行來獲取欄位名稱
-    df = pd.read_csv(csv_path, nrows=1)
-    columns = df.columns.tolist()
+    # 清理欄位名稱
+    original_columns = df.columns.tolist()
+    unique_columns = clean_column_names(original_columns, logger)
     
-    schema = []
+    # 一次套用所有清理後的欄位名稱（依位置指定，不逐欄 rename）
+    df.columns = unique_columns
     
-    for column in columns:
-        # 根據欄位名稱推斷資料類型
-        # 特定欄位必須保持字串格式，避免小數點
-        if column in ['product_manufacturer_code', 'product_sku_main', 'product_barcode', 'product_spec']:
-            bq_type = bigquery.SqlTypeNames.STRING
-        elif column in ['quantity', 'product_cost_untaxed', 'platform_product_cost', 'product_original_price', 'product_cost_from_catalog',
-                     'product_weight_g', 'product_min_qty', 'product_msrp', 'product_price',
-                     'product_supplier_price', 'product_list_price', 'single_product_id']:
-            bq_type = bigquery.SqlTypeNames.FLOAT
-        elif column in ['is_abnormal_order', 'shop_is_ad_shopee_ads_enabled']:
-            bq_type = bigquery.SqlTypeNames.BOOLEAN
-        elif column in ['order_date', 'actual_shipping_date', 'ship_by_date', 'product_price_date']:
-            bq_type = bigquery.SqlTypeNames.DATE
-        elif column in ['order_transfer_date', 'bq_processing_timestamp']:
-            bq_type = bigquery.SqlTypeNames.DATETIME
-        else:
-            bq_type = bigquery.SqlTypeNames.STRING
-        
-        schema.append(bigquery.SchemaField(column, bq_type))
+    logger.info(f"清理完成: {len(original_columns)} -> {len(unique_columns)} 個欄位")
+    return df
+
+def generate_bigquery_schema_from_csv(columns):
+    """根據清理後的 CSV 實際欄位生成 BigQuery schema
     
-    return schema
+    相同欄位組合的 Schema 只建立一次，之後直接重複使用。
+    """
+    return list(_build_schema(tuple(columns)))
+
+@lru_cache(maxsize=8)
+def _build_schema(columns):
+    """為每個欄位生成 Schema（未列於 MOMO_FIELD_TYPES 的欄位為 STRING）"""
+    return tuple(
+        bigquery.SchemaField(column, MOMO_FIELD_TYPES.get(column, bigquery.SqlTypeNames.STRING))
+        for column in columns
+    )
 
 def validate_csv_file(csv_path, logger):
     """驗證 CSV 檔案格式"""
@@ -242,9 +268,13 @@ def main():
     parser.add_argument("--mode", choices=["truncate", "append", "empty"], 
                        default="truncate", help="上傳模式 (預設: truncate)")
     parser.add_argument("--csv-file", help="指定 CSV 檔案路徑 (預設: 自動找最新)")
-    parser.add_argument("--credential", default="config/bigquery_uploader_key.json",
+    parser.add_argument("--credential", default=get_credential_path(),
                        help="BigQuery 認證檔案路徑")
     parser.add_argument("--dry-run", action="store_true", help="僅檢查檔案，不上傳")
+    parser.add_argument("--schema-only", action="store_true",
+                       help="只讀取 CSV 標題列並輸出 BigQuery schema，不讀取資料列、不上傳")
+    parser.add_argument("--use-storage-write", action="store_true",
+                       help="改用 BigQuery Storage Write API 追加寫入（需搭配 --mode append；選用功能，需另行安裝 google-cloud-bigquery-storage）")
     
     args = parser.parse_args()
     
@@ -265,15 +295,24 @@ def main():
         if not os.path.exists(csv_path):
             raise FileNotFoundError(f"CSV 檔案不存在: {csv_path}")
         
+        # 只檢查 schema：依標題列推導清理後的欄位名稱，不解析資料列
+        if args.schema_only:
+            columns = clean_column_names(mangle_duplicate_columns(read_csv_header(csv_path)), logger)
+            schema = generate_bigquery_schema_from_csv(columns)
+            logger.info(f"=== SCHEMA ({len(schema)} 個欄位) ===")
+            for field in schema:
+                logger.info(f"  {field.name}: {field.field_type}")
+            return
+        
         # 2. 驗證 CSV 檔案
         if not validate_csv_file(csv_path, logger):
             raise ValueError("CSV 檔案格式驗證失敗")
         
         # 3. 清理重複欄位
-        cleaned_csv_path = clean_csv_duplicate_columns(csv_path, logger)
+        df = clean_csv_duplicate_columns(csv_path, logger)
         
-        # 4. 生成 BigQuery schema（根據清理後的CSV檔案實際欄位）
-        schema = generate_bigquery_schema_from_csv(cleaned_csv_path)
+        # 4. 生成 BigQuery schema（根據清理後的實際欄位）
+        schema = generate_bigquery_schema_from_csv(df.columns.tolist())
         logger.info(f"生成 BigQuery schema: {len(schema)} 個欄位")
         
         # 5. 檢查認證檔案
@@ -306,14 +345,16 @@ def main():
         
         # 9. 上傳到 BigQuery
         logger.info("開始上傳到 BigQuery...")
-        success = upload_csv_to_bq(
+        success = upload_dataframe_to_bq(
             client=client,
-            csv_path=cleaned_csv_path,
+            df=df,
             dataset_id=MOMO_DATASET,
             table_id=MOMO_TABLE,
             schema=schema,
             write_disposition=write_disposition,
-            logger=logger
+            logger=logger,
+            use_storage_write=args.use_storage_write,
+            credentials=get_bq_credentials(args.credential)
         )
         
         if success:
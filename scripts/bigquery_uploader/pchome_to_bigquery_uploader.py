@@ -22,15 +22,16 @@ import os
 import sys
 import pandas as pd
 import logging
-import glob
 import json
 from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
 
 # ✅ 將專案根目錄加入 sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
 # ✅ 使用相對 import
-from bigquery_utils import get_bq_client, upload_csv_to_bq, check_duplicate_order_sn
+from bigquery_utils import get_bq_client, get_bq_credentials, find_latest_file, read_csv_header, upload_csv_to_bq, check_duplicate_order_sn
 from google.cloud import bigquery
 
 # PChome 專用設定
@@ -38,39 +39,56 @@ PCHOME_DATASET = "yichai_pchome_data"
 PCHOME_TABLE = "pchome_orders_data"
 PCHOME_PROJECT = "shopee-etl-reporting"
 
+# 資料摘要與重複檢查只需要這些欄位，其餘欄位直接以檔案串流上傳
+SUMMARY_COLUMNS = {'platform', 'shop_id', 'order_date', 'price_total', 'product_id', 'order_sn', 'order_id'}
+
+# 資料摘要分批讀取的每批筆數，記憶體用量只與批次大小成正比
+SUMMARY_CHUNK_SIZE = 100_000
+
+# ISO 日期字串（YYYY-MM-DD）的字典序即為日期順序，可直接比較字串取最小／最大值
+ISO_DATE_PATTERN = r'\d{4}-\d{2}-\d{2}'
+
+# 專案根目錄（本檔案往上兩層），路徑不受執行時的工作目錄影響
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
 def get_csv_pattern():
-    """根據當前工作目錄動態設定 CSV 檔案路徑
+    """CSV 檔案路徑模式
     
     現在讀取 data_processed/merged 目錄下的腳本 06 輸出檔案
     """
-    current_dir = os.getcwd()
-    
-    # 如果當前目錄是專案根目錄
-    if os.path.basename(current_dir) == "ec-data-pipeline":
-        return "data_processed/merged/pchome_orders_bq_formatted_*.csv"
-    else:
-        # 如果從其他目錄執行，使用絕對路徑
-        return os.path.join(current_dir, "data_processed/merged/pchome_orders_bq_formatted_*.csv")
+    return str(PROJECT_ROOT / "data_processed" / "merged" / "pchome_orders_bq_formatted_*.csv")
+
+def get_credential_path():
+    """認證檔案路徑"""
+    return str(PROJECT_ROOT / "config" / "bigquery_uploader_key.json")
+
+def get_mapping_path():
+    """PChome 欄位對應表路徑"""
+    return str(PROJECT_ROOT / "config" / "pchome_fields_mapping.json")
 
 def get_latest_csv_file():
     """取得最新的 PChome BigQuery 格式 CSV 檔案"""
     pattern = get_csv_pattern()
-    files = glob.glob(pattern)
-    
-    if not files:
+    latest_file = find_latest_file(*os.path.split(pattern))
+    if latest_file is None:
         raise FileNotFoundError(f"找不到符合模式的檔案: {pattern}")
-    
-    # 按修改時間排序，取得最新的檔案
-    latest_file = max(files, key=os.path.getmtime)
     return latest_file
 
 def load_pchome_schema():
-    """載入 PChome 欄位對應表並生成 BigQuery Schema"""
-    schema_path = "config/pchome_fields_mapping.json"
+    """載入 PChome 欄位對應表並生成 BigQuery Schema
+    
+    依對應表的修改時間快取，同一行程內檔案未變更時直接重複使用已建立的 Schema。
+    """
+    schema_path = get_mapping_path()
     
     if not os.path.exists(schema_path):
         raise FileNotFoundError(f"找不到 PChome 欄位對應表: {schema_path}")
     
+    return list(_build_pchome_schema(schema_path, os.stat(schema_path).st_mtime_ns))
+
+@lru_cache(maxsize=4)
+def _build_pchome_schema(schema_path, mtime_ns):
+    """讀取對應表並建立 Schema（以路徑與修改時間為快取鍵）"""
     with open(schema_path, 'r', encoding='utf-8') as f:
         mapping = json.load(f)
     
@@ -162,7 +180,54 @@ def load_pchome_schema():
     for field_name, field_type in all_fields.items():
         schema_fields.append(bigquery.SchemaField(field_name, field_type))
     
-    return schema_fields
+    return tuple(schema_fields)
+
+def summarize_csv(csv_file, check_duplicates=False, chunksize=SUMMARY_CHUNK_SIZE):
+    """分批讀取 CSV 摘要欄位，累計筆數、日期範圍、總金額與不重複數
+    
+    回傳摘要 dict（CSV 缺少的欄位其累計值為 None）；
+    check_duplicates 為 True 時以集合逐批累計 order_id，同時計算重複數量。
+    """
+    columns = set(read_csv_header(csv_file))
+    summary = {
+        'rows': 0, 'platform': 'N/A', 'shop_id': 'N/A',
+        'min_date': None, 'max_date': None,
+        'total_amount': 0.0 if 'price_total' in columns else None,
+        'product_ids': set() if 'product_id' in columns else None,
+        'order_sns': set() if 'order_sn' in columns else None,
+        'duplicate_order_ids': 0 if check_duplicates else None,
+    }
+    seen_order_ids = set()
+    reader = pd.read_csv(csv_file, dtype=str, keep_default_na=False,
+                         usecols=lambda col: col in SUMMARY_COLUMNS, chunksize=chunksize)
+    for chunk in reader:
+        if summary['rows'] == 0 and len(chunk) > 0:
+            summary['platform'] = chunk['platform'].iloc[0]
+            summary['shop_id'] = chunk['shop_id'].iloc[0]
+        summary['rows'] += len(chunk)
+        
+        if 'order_date' in columns:
+            order_dates = chunk['order_date'][chunk['order_date'] != '']
+            if not order_dates.str.fullmatch(ISO_DATE_PATTERN).all():
+                # 非 ISO 格式時才逐筆解析日期，再轉回 ISO 字串比較
+                order_dates = pd.to_datetime(order_dates, errors='coerce').dropna().dt.strftime('%Y-%m-%d')
+            if not order_dates.empty:
+                summary['min_date'] = min(filter(None, [summary['min_date'], order_dates.min()]))
+                summary['max_date'] = max(filter(None, [summary['max_date'], order_dates.max()]))
+        if summary['total_amount'] is not None:
+            summary['total_amount'] += pd.to_numeric(chunk['price_total'], errors='coerce').sum()
+        if summary['product_ids'] is not None:
+            summary['product_ids'].update(chunk['product_id'])
+        if summary['order_sns'] is not None:
+            summary['order_sns'].update(chunk['order_sn'])
+        if check_duplicates:
+            # 已出現過的 order_id 計為重複，不保留整欄資料
+            for order_id in chunk['order_id'].values:
+                if order_id in seen_order_ids:
+                    summary['duplicate_order_ids'] += 1
+                else:
+                    seen_order_ids.add(order_id)
+    return summary
 
 def setup_logging():
     """設定 BigQuery 上傳器的日誌系統"""
@@ -198,6 +263,11 @@ def main():
     parser.add_argument('--file', help='指定 CSV 檔案路徑 (預設: 自動找最新檔案)')
     parser.add_argument('--dry-run', action='store_true', help='預覽模式，不實際上傳')
     parser.add_argument('--check-duplicates', action='store_true', help='檢查重複資料')
+    parser.add_argument('--gzip', action='store_true', help='以 gzip 壓縮 CSV 後再上傳（減少傳輸量）')
+    parser.add_argument('--parquet', action='store_true', help='先在本機轉為 Parquet 再上傳（優先於 --gzip）')
+    parser.add_argument('--staging-bucket', help='GCS 暫存桶名稱（指定時先上傳至 GCS 再由 BigQuery 載入）')
+    parser.add_argument('--use-storage-write', action='store_true',
+                       help='改用 BigQuery Storage Write API 追加寫入（需搭配 --mode WRITE_APPEND；選用功能，需另行安裝 google-cloud-bigquery-storage）')
     
     args = parser.parse_args()
     
@@ -215,35 +285,30 @@ def main():
         
         logger.info(f"使用 CSV 檔案: {csv_file}")
         
-        # 讀取 CSV 檔案
+        # 分批讀取 CSV 檔案摘要欄位（不整份載入記憶體）
         logger.info("讀取 CSV 檔案...")
-        df = pd.read_csv(csv_file, dtype=str, keep_default_na=False)
-        logger.info(f"CSV 檔案筆數: {len(df)}")
-        logger.info(f"CSV 檔案欄位數: {len(df.columns)}")
+        summary = summarize_csv(csv_file, check_duplicates=args.check_duplicates)
+        logger.info(f"CSV 檔案筆數: {summary['rows']}")
+        logger.info(f"CSV 檔案欄位數: {len(read_csv_header(csv_file))}")
         
         # 顯示資料摘要
         logger.info("\n=== 資料摘要 ===")
-        logger.info(f"平台: {df['platform'].iloc[0] if len(df) > 0 else 'N/A'}")
-        logger.info(f"商店ID: {df['shop_id'].iloc[0] if len(df) > 0 else 'N/A'}")
+        logger.info(f"平台: {summary['platform']}")
+        logger.info(f"商店ID: {summary['shop_id']}")
         
-        if 'order_date' in df.columns and df['order_date'].notna().any():
-            order_dates = pd.to_datetime(df['order_date'], errors='coerce')
-            min_date = order_dates.min()
-            max_date = order_dates.max()
-            logger.info(f"訂單日期範圍: {min_date.strftime('%Y-%m-%d') if pd.notna(min_date) else 'N/A'} ~ {max_date.strftime('%Y-%m-%d') if pd.notna(max_date) else 'N/A'}")
+        if summary['rows'] > 0:
+            logger.info(f"訂單日期範圍: {summary['min_date'] or 'N/A'} ~ {summary['max_date'] or 'N/A'}")
         
-        if 'price_total' in df.columns:
-            df['price_total'] = pd.to_numeric(df['price_total'], errors='coerce')
-            total_amount = df['price_total'].sum()
-            logger.info(f"總金額: {total_amount:,.0f}")
+        if summary['total_amount'] is not None:
+            logger.info(f"總金額: {summary['total_amount']:,.0f}")
         
-        logger.info(f"商品種類數: {df['product_id'].nunique() if 'product_id' in df.columns else 'N/A'}")
-        logger.info(f"訂單數: {df['order_sn'].nunique() if 'order_sn' in df.columns else 'N/A'}")
+        logger.info(f"商品種類數: {len(summary['product_ids']) if summary['product_ids'] is not None else 'N/A'}")
+        logger.info(f"訂單數: {len(summary['order_sns']) if summary['order_sns'] is not None else 'N/A'}")
         
         # 檢查重複資料
         if args.check_duplicates:
             logger.info("\n=== 檢查重複資料 ===")
-            duplicate_count = df.duplicated(subset=['order_id']).sum()
+            duplicate_count = summary['duplicate_order_ids']
             logger.info(f"重複的 order_id 數量: {duplicate_count}")
             
             if duplicate_count > 0:
@@ -261,7 +326,7 @@ def main():
         
         # 取得 BigQuery 客戶端
         logger.info("\n=== 開始上傳至 BigQuery ===")
-        key_path = "config/bigquery_uploader_key.json"
+        key_path = get_credential_path()
         client = get_bq_client(key_path)
         
         # 載入 Schema
@@ -271,6 +336,8 @@ def main():
         # 上傳至 BigQuery
         table_id = f"{PCHOME_PROJECT}.{PCHOME_DATASET}.{PCHOME_TABLE}"
         logger.info(f"上傳至: {table_id}")
+        if args.staging_bucket:
+            logger.info(f"經 GCS 暫存桶載入: {args.staging_bucket}")
         
         result = upload_csv_to_bq(
             client=client,
@@ -279,12 +346,17 @@ def main():
             table_id=PCHOME_TABLE,
             schema=schema,
             write_disposition=args.mode,
-            logger=logger
+            logger=logger,
+            staging_bucket=args.staging_bucket,
+            as_parquet=args.parquet,
+            gzip_csv=args.gzip,
+            use_storage_write=args.use_storage_write,
+            credentials=get_bq_credentials(key_path)
         )
         
         if result:
             logger.info("✅ 上傳成功！")
-            logger.info(f"上傳筆數: {len(df)}")
+            logger.info(f"上傳筆數: {summary['rows']}")
         else:
             logger.error("❌ 上傳失敗！")
             sys.exit(1)
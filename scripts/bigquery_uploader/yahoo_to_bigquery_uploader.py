@@ -9,15 +9,18 @@ Authors: 楊翔志 & AI Collective
 Studio: tranquility-base
 """
 
+import argparse
 import sys
 import logging
-import pandas as pd
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, Any, Optional, List
 from google.cloud import bigquery
 from google.oauth2 import service_account
 
+from bigquery_utils import find_latest_file, gzip_to_buffer, load_file_to_bq, read_csv_as_arrow, read_csv_header, upload_arrow_table_to_bq
+
 # 設定路徑
 SCRIPT_DIR = Path(__file__).parent
 PROJECT_ROOT = SCRIPT_DIR.parent.parent
@@ -37,6 +40,39 @@ FULL_TABLE_ID = f"{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}"
 # 認證檔案路徑
 CREDENTIAL_PATH = CONFIG_DIR / "bigquery_uploader_key.json"
 
+# 欄位類型映射（未列出的欄位一律為 STRING）
+YAHOO_FIELD_TYPES = {
+    # 日期類型
+    'order_date': 'DATE',
+    'return_order_create_date': 'DATE',
+    'return_completion_date': 'DATE',
+    'return_case_close_date': 'DATE',
+    'return_penalty_start_date': 'DATE',
+    'processing_date': 'DATE',
+    
+    # 日期時間類型
+    'order_transfer_date': 'DATETIME',
+    'latest_shipping_date': 'DATETIME',
+    'return_processing': 'DATETIME',
+    
+    # 數字類型
+    'product_cost': 'FLOAT64',
+    'cost_subtotal': 'FLOAT64',
+    'amount_subtotal': 'FLOAT64',
+    'shipping_fee': 'FLOAT64',
+    'store_collection_amount': 'FLOAT64',
+    'weight_g': 'FLOAT64',
+    'msrp': 'FLOAT64',
+    'price': 'FLOAT64',
+    'supplier_price': 'FLOAT64',
+    'list_price': 'FLOAT64',
+    'cost': 'FLOAT64',
+    'quantity': 'FLOAT64',
+    
+    # 布林值類型
+    'shop_status': 'BOOL',
+}
+
 # 設定日誌
 def setup_logging():
     """設定日誌"""
@@ -64,15 +100,14 @@ def find_latest_csv_file(input_dir: Path, pattern: str) -> Optional[Path]:
             logging.error(f"輸入目錄不存在：{input_dir}")
             return None
         
-        # 尋找所有符合模式的 CSV 檔案
-        csv_files = list(input_dir.glob(pattern))
+        # 單次掃描目錄，取符合模式且修改時間最新的 CSV 檔案
+        latest_file = find_latest_file(str(input_dir), pattern)
         
-        if not csv_files:
+        if latest_file is None:
             logging.warning(f"在 {input_dir} 中找不到 {pattern} 檔案")
             return None
         
-        # 按檔案修改時間排序，取最新的
-        latest_file = max(csv_files, key=lambda x: x.stat().st_mtime)
+        latest_file = Path(latest_file)
         logging.info(f"找到最新的 CSV 檔案：{latest_file.name}")
         
         return latest_file
@@ -81,56 +116,46 @@ def find_latest_csv_file(input_dir: Path, pattern: str) -> Optional[Path]:
         logging.error(f"尋找最新 CSV 檔案時發生錯誤：{e}")
         return None
 
+@lru_cache(maxsize=None)
+def _load_credentials() -> Optional[service_account.Credentials]:
+    """載入服務帳號憑證（快取），沒有認證檔案時回傳 None 表示使用預設認證"""
+    if CREDENTIAL_PATH.exists():
+        return service_account.Credentials.from_service_account_file(
+            str(CREDENTIAL_PATH),
+            scopes=["https://www.googleapis.com/auth/cloud-platform"]
+        )
+    return None
+
+@lru_cache(maxsize=None)
+def _build_bigquery_client() -> bigquery.Client:
+    """建立 BigQuery 客戶端（快取，同一行程重複呼叫不再重新認證）"""
+    credentials = _load_credentials()
+    if credentials is not None:
+        client = bigquery.Client(credentials=credentials, project=PROJECT_ID)
+        logging.info(f"使用認證檔案：{CREDENTIAL_PATH}")
+    else:
+        # 使用預設認證
+        client = bigquery.Client(project=PROJECT_ID)
+        logging.info("使用預設認證")
+    
+    return client
+
 def get_bigquery_client() -> Optional[bigquery.Client]:
     """取得 BigQuery 客戶端"""
     try:
-        if CREDENTIAL_PATH.exists():
-            credentials = service_account.Credentials.from_service_account_file(
-                str(CREDENTIAL_PATH),
-                scopes=["https://www.googleapis.com/auth/cloud-platform"]
-            )
-            client = bigquery.Client(credentials=credentials, project=PROJECT_ID)
-            logging.info(f"使用認證檔案：{CREDENTIAL_PATH}")
-        else:
-            # 使用預設認證
-            client = bigquery.Client(project=PROJECT_ID)
-            logging.info("使用預設認證")
-        
-        return client
+        return _build_bigquery_client()
         
     except Exception as e:
         logging.error(f"建立 BigQuery 客戶端時發生錯誤：{e}")
         return None
 
-def generate_schema_from_csv(df: pd.DataFrame) -> List[bigquery.SchemaField]:
-    """根據 CSV 資料生成 BigQuery Schema"""
+def generate_schema_from_csv(columns: List[str]) -> List[bigquery.SchemaField]:
+    """根據 CSV 欄位名稱生成 BigQuery Schema（類型由欄位名稱決定，不需讀取資料）"""
     try:
-        schema = []
-        
-        for column in df.columns:
-            # 根據資料內容推斷類型
-            sample_data = df[column].dropna().head(100)
-            
-            if len(sample_data) == 0:
-                # 如果沒有資料，預設為 STRING
-                schema.append(bigquery.SchemaField(column, "STRING", mode="NULLABLE"))
-                continue
-            
-            # 嘗試推斷類型
-            if column in ['order_date', 'return_order_create_date', 'return_completion_date', 
-                         'return_case_close_date', 'return_penalty_start_date', 'processing_date']:
-                schema.append(bigquery.SchemaField(column, "DATE", mode="NULLABLE"))
-            elif column in ['order_transfer_date', 'latest_shipping_date', 'return_processing']:
-                schema.append(bigquery.SchemaField(column, "DATETIME", mode="NULLABLE"))
-            elif column in ['product_cost', 'cost_subtotal', 'amount_subtotal', 'shipping_fee', 
-                           'store_collection_amount', 'weight_g', 'msrp', 'price', 'supplier_price', 
-                           'list_price', 'cost', 'quantity']:
-                schema.append(bigquery.SchemaField(column, "FLOAT64", mode="NULLABLE"))
-            elif column in ['shop_status']:
-                schema.append(bigquery.SchemaField(column, "BOOL", mode="NULLABLE"))
-            else:
-                # 預設為 STRING
-                schema.append(bigquery.SchemaField(column, "STRING", mode="NULLABLE"))
+        schema = [
+            bigquery.SchemaField(column, YAHOO_FIELD_TYPES.get(column, "STRING"), mode="NULLABLE")
+            for column in columns
+        ]
         
         logging.info(f"生成 Schema，共 {len(schema)} 個欄位")
         return schema
@@ -139,23 +164,40 @@ def generate_schema_from_csv(df: pd.DataFrame) -> List[bigquery.SchemaField]:
         logging.error(f"生成 Schema 時發生錯誤：{e}")
         return []
 
-def upload_to_bigquery(client: bigquery.Client, csv_file: Path, logger: logging.Logger) -> bool:
-    """上傳 CSV 到 BigQuery"""
+def upload_to_bigquery(client: bigquery.Client, csv_file: Path, logger: logging.Logger,
+                       staging_bucket: Optional[str] = None, gzip_csv: bool = False,
+                       as_parquet: bool = False) -> bool:
+    """上傳 CSV 到 BigQuery
+    
+    指定 staging_bucket 時先上傳至 GCS 再由 BigQuery 載入；
+    gzip_csv 為 True 時先以 gzip 壓縮再送出（BigQuery 無法平行解析 gzip 檔案，適合頻寬受限的環境）；
+    as_parquet 為 True 時先依 Schema 在本機轉為 Parquet 再上傳，BigQuery 端不需解析 CSV 文字。
+    """
     try:
         logger.info(f"開始上傳檔案：{csv_file.name}")
         
-        # 讀取 CSV 檔案
-        logger.info("讀取 CSV 檔案...")
-        df = pd.read_csv(csv_file, dtype=str, encoding='utf-8-sig')
-        logger.info(f"成功讀取 CSV，共 {len(df)} 行，{len(df.columns)} 個欄位")
+        # 只讀取標題列，資料列直接以檔案串流上傳，不載入 DataFrame
+        columns = read_csv_header(csv_file)
+        logger.info(f"成功讀取 CSV 標題列，共 {len(columns)} 個欄位")
         
         # 生成 Schema
         logger.info("生成 BigQuery Schema...")
-        schema = generate_schema_from_csv(df)
+        schema = generate_schema_from_csv(columns)
         if not schema:
             logger.error("無法生成 Schema")
             return False
         
+        if as_parquet:
+            logger.info(f"轉換為 Parquet 並上傳到 BigQuery 表格：{FULL_TABLE_ID}")
+            table = read_csv_as_arrow(str(csv_file), schema)
+            return upload_arrow_table_to_bq(
+                client, table, DATASET_ID, TABLE_ID, schema,
+                write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,  # 覆蓋模式
+                logger=logger,
+                staging_bucket=staging_bucket,
+                credentials=_load_credentials()
+            )
+        
         # 設定作業配置
         job_config = bigquery.LoadJobConfig(
             schema=schema,
@@ -170,17 +212,18 @@ def upload_to_bigquery(client: bigquery.Client, csv_file: Path, logger: logging.
         # 開始上傳
         logger.info(f"開始上傳到 BigQuery 表格：{FULL_TABLE_ID}")
         
+        logger.info("等待上傳作業完成...")
         with open(csv_file, "rb") as source_file:
-            job = client.load_table_from_file(
-                source_file,
-                FULL_TABLE_ID,
-                job_config=job_config
+            source_name = csv_file.name
+            if gzip_csv:
+                source_file = gzip_to_buffer(source_file)
+                source_name += ".gz"
+                logger.info(f"已以 gzip 壓縮：{source_file.getbuffer().nbytes / 1024 / 1024:.2f} MB")
+            job = load_file_to_bq(
+                client, source_file, source_name, FULL_TABLE_ID, TABLE_ID,
+                job_config, logger, staging_bucket, _load_credentials()
             )
         
-        # 等待作業完成
-        logger.info("等待上傳作業完成...")
-        job.result()  # 等待作業完成
-        
         # 檢查結果
         if job.errors:
             logger.error(f"上傳作業發生錯誤：{job.errors}")
@@ -188,7 +231,7 @@ def upload_to_bigquery(client: bigquery.Client, csv_file: Path, logger: logging.
         
         # 獲取表格資訊
         table = client.get_table(FULL_TABLE_ID)
-        logger.info(f"✅ 上傳成功！表格行數：{table.num_rows}")
+        logger.info(f"✅ 上傳成功！載入 {job.output_rows} 行，表格行數：{table.num_rows}")
         
         return True
         
@@ -200,6 +243,12 @@ def upload_to_bigquery(client: bigquery.Client, csv_file: Path, logger: logging.
 
 def main():
     """主函數"""
+    parser = argparse.ArgumentParser(description="Yahoo 訂單 BigQuery 上傳")
+    parser.add_argument("--staging-bucket", help="GCS 暫存桶名稱（指定時先上傳至 GCS 再由 BigQuery 載入）")
+    parser.add_argument("--gzip", action="store_true", help="以 gzip 壓縮 CSV 後再上傳（減少傳輸量）")
+    parser.add_argument("--parquet", action="store_true", help="先在本機轉為 Parquet 再上傳（優先於 --gzip）")
+    args = parser.parse_args()
+    
     logger = setup_logging()
     logger.info("=== Yahoo 訂單 BigQuery 上傳作業開始 ===")
     
@@ -225,7 +274,7 @@ def main():
         
         # 3. 上傳到 BigQuery
         logger.info("步驟 3：上傳到 BigQuery")
-        if upload_to_bigquery(client, latest_csv, logger):
+        if upload_to_bigquery(client, latest_csv, logger, args.staging_bucket, args.gzip, args.parquet):
             logger.info("✅ BigQuery 上傳作業完成！")
         else:
             logger.error("❌ 上傳失敗")
@@ -10,7 +10,7 @@
 🎯 核心重點：
     1. 智能重複檢測：先按檔案大小分組，再進行內容級別的雜湊值比較
     2. Excel 內容解析：直接讀取 Excel 檔案內容進行雜湊計算，避免格式差異誤判
-    3. 多層級檢查：檔案大小 → 內容雜湊 → 重複檔案識別
+    3. 多層級檢查：檔案大小 → 頭尾取樣雜湊 → 內容雜湊 → 重複檔案識別
     4. 清理建議：提供具體的檔案清理策略和建議
 
 🔧 主要功能：
@@ -37,8 +37,8 @@
     - 可修改 main() 函數中的 backup_dir 變數
 
 🔍 檢測方法：
-    - Excel 檔案：直接讀取內容並計算雜湊值
-    - 其他檔案：使用檔案 MD5 雜湊值
+    - Excel 檔案：逐列串流讀取儲存格內容並計算雜湊值
+    - 其他檔案：使用檔案 BLAKE3 雜湊值（未安裝 blake3 時使用 BLAKE2b）
     - 支援格式：.xlsx, .xls 等 Excel 格式
 
 📈 輸出資訊：
@@ -56,33 +56,165 @@
 
 import os
 import hashlib
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+import openpyxl
 import pandas as pd
 from collections import defaultdict
 
+try:
+    from python_calamine import CalamineWorkbook  # Rust 實作，讀取 .xls 比 xlrd 快一個數量級
+except ImportError:
+    CalamineWorkbook = None  # 交由 pandas 以 xlrd 讀取
+
+# 去重不需密碼學強度，優先使用 BLAKE3（SIMD 加速）；未安裝時退回標準函式庫的 BLAKE2b
+try:
+    from blake3 import blake3 as new_file_hasher
+except ImportError:
+    new_file_hasher = hashlib.blake2b
+
+# 每次讀取 1 MiB，減少 Python 層的迴圈次數
+HASH_CHUNK_SIZE = 1 << 20
+
+# 取樣雜湊讀取檔案頭尾各 64 KB
+SAMPLE_SIZE = 64 * 1024
+
+# 平行計算雜湊的工作數上限（避免傳統硬碟因大量隨機讀取而變慢）
+HASH_MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+# 雜湊快取的種類名稱帶上演算法，切換 BLAKE3／BLAKE2b 時不會沿用舊快取
+HASH_NAME = new_file_hasher().name
+
+def open_hash_cache(directory):
+    """開啟（或建立）放在檢查目錄旁的雜湊快取資料庫
+    
+    以 (路徑, 種類) 為鍵記錄檔案大小、修改時間與雜湊值，兩者都未變更的檔案下次直接沿用。
+    """
+    directory = Path(directory).resolve()
+    connection = sqlite3.connect(directory.parent / f".{directory.name}_hash_cache.sqlite")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS file_hashes ("
+        "path TEXT, kind TEXT, size INTEGER, mtime_ns INTEGER, hash TEXT, PRIMARY KEY (path, kind))"
+    )
+    return connection
+
+def get_cached_hashes(hash_cache, kind, file_list, file_stats, hash_map, cache_failures=False):
+    """回傳 {檔案: 雜湊}；大小與修改時間未變的檔案取自快取，其餘以 hash_map 計算後寫回快取
+    
+    cache_failures 為 True 時連同無法計算（None）的結果一併快取，例如非 Excel 檔案。
+    """
+    kind = f"{kind}:{HASH_NAME}"
+    hashes = {}
+    missing_files = []
+    for file_path in file_list:
+        row = hash_cache.execute(
+            "SELECT hash FROM file_hashes WHERE path = ? AND kind = ? AND size = ? AND mtime_ns = ?",
+            (str(file_path), kind, *file_stats[file_path])
+        ).fetchone()
+        if row is None:
+            missing_files.append(file_path)
+        else:
+            hashes[file_path] = row[0]
+    
+    if missing_files:
+        hashes.update(zip(missing_files, hash_map(missing_files)))
+        hash_cache.executemany(
+            "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?)",
+            [(str(file_path), kind, *file_stats[file_path], hashes[file_path])
+             for file_path in missing_files if cache_failures or hashes[file_path] is not None]
+        )
+    return hashes
+
 def get_file_hash(file_path):
-    """計算檔案的 MD5 雜湊值"""
-    hash_md5 = hashlib.md5()
+    """計算檔案內容的雜湊值（BLAKE3，未安裝時為 BLAKE2b）"""
+    file_hash = new_file_hasher()
+    buffer = memoryview(bytearray(HASH_CHUNK_SIZE))
+    try:
+        with open(file_path, "rb", buffering=0) as f:
+            while n := f.readinto(buffer):
+                file_hash.update(buffer[:n])
+        return file_hash.hexdigest()
+    except Exception as e:
+        print(f"無法讀取檔案 {file_path}: {e}")
+        return None
+
+def get_sample_hash(file_path, size, sample_size=SAMPLE_SIZE):
+    """只讀取檔案頭尾各 sample_size 位元組計算雜湊，快速排除內容不同的檔案"""
+    sample_hash = new_file_hasher(str(size).encode())
     try:
         with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+            sample_hash.update(f.read(sample_size))
+            if size > sample_size:
+                f.seek(max(sample_size, size - sample_size))
+                sample_hash.update(f.read(sample_size))
+        return sample_hash.hexdigest()
     except Exception as e:
         print(f"無法讀取檔案 {file_path}: {e}")
         return None
 
+def group_by_file_hash(work, hash_cache, file_stats):
+    """依檔案內容雜湊分組，work 為 (檔案大小, 檔案路徑) 清單，回傳 {大小: {雜湊: [檔案]}}
+    
+    先以頭尾取樣雜湊分組，只有取樣相同的檔案才讀取完整內容計算雜湊（完整雜湊經快取）；
+    檔案不超過兩倍取樣大小時，取樣即為完整內容，不再重讀。
+    """
+    sizes = [size for size, _ in work]
+    file_list = [file_path for _, file_path in work]
+    
+    # 雜湊計算會釋放 GIL，以執行緒平行讀取與計算；所有大小分組一次處理
+    with ThreadPoolExecutor(max_workers=HASH_MAX_WORKERS) as executor:
+        sample_groups = defaultdict(list)
+        for size, file_path, sample_hash in zip(sizes, file_list, executor.map(get_sample_hash, file_list, sizes)):
+            if sample_hash:
+                sample_groups[size, sample_hash].append(file_path)
+        
+        results = defaultdict(lambda: defaultdict(list))
+        full_hash_work = []
+        for (size, sample_hash), sample_files in sample_groups.items():
+            if len(sample_files) < 2:
+                continue
+            if size <= SAMPLE_SIZE * 2:
+                results[size][sample_hash].extend(sample_files)
+            else:
+                full_hash_work.extend((size, file_path) for file_path in sample_files)
+        
+        full_hash_files = [file_path for _, file_path in full_hash_work]
+        full_hashes = get_cached_hashes(
+            hash_cache, "file", full_hash_files, file_stats,
+            lambda files: executor.map(get_file_hash, files)
+        )
+        for size, file_path in full_hash_work:
+            file_hash = full_hashes[file_path]
+            if file_hash:
+                results[size][file_hash].append(file_path)
+    return results
+
+def hash_rows(rows):
+    """逐列計算儲存格內容的雜湊值（儲存格以 \\x1f 分隔、列以換行分隔）"""
+    content_hash = new_file_hasher()
+    for row in rows:
+        content_hash.update('\x1f'.join('' if value is None else repr(value) for value in row).encode('utf-8'))
+        content_hash.update(b'\n')
+    return content_hash.hexdigest()
+
 def get_excel_content_hash(file_path):
-    """讀取 Excel 檔案內容並計算雜湊值"""
+    """讀取 Excel 檔案第一個工作表的內容並計算雜湊值
+    
+    .xlsx 以 openpyxl 唯讀模式逐列串流，其他格式優先以 calamine 逐列讀取，
+    不建立整張表的 DataFrame。
+    """
     try:
         if file_path.suffix.lower() == '.xlsx':
-            df = pd.read_excel(file_path, engine='openpyxl')
-        else:
-            df = pd.read_excel(file_path, engine='xlrd')
-        
-        # 將 DataFrame 轉換為字串並計算雜湊
-        content_str = df.to_string(index=False)
-        return hashlib.md5(content_str.encode('utf-8')).hexdigest()
+            workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                return hash_rows(workbook.worksheets[0].iter_rows(values_only=True))
+            finally:
+                workbook.close()
+        if CalamineWorkbook is not None:
+            return hash_rows(CalamineWorkbook.from_path(str(file_path)).get_sheet_by_index(0).iter_rows())
+        df = pd.read_excel(file_path, engine='xlrd', header=None)
+        return hash_rows(df.itertuples(index=False, name=None))
     except Exception as e:
         print(f"無法讀取 Excel 檔案 {file_path}: {e}")
         return None
@@ -92,58 +224,49 @@ def check_duplicates(directory):
     print(f"檢查目錄：{directory}")
     print("=" * 60)
     
-    # 收集所有檔案
-    files = []
-    for file_path in Path(directory).glob("*"):
-        if file_path.is_file():
-            files.append(file_path)
+    # 收集所有檔案並按檔案大小分組（os.scandir 的目錄項目會快取 stat 結果）
+    file_count = 0
+    size_groups = defaultdict(list)
+    mtimes = {}
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_file():
+                size_groups[entry.stat().st_size].append(entry.path)
+                mtimes[entry.path] = entry.stat().st_mtime_ns
+                file_count += 1
     
-    print(f"總共找到 {len(files)} 個檔案")
+    print(f"總共找到 {file_count} 個檔案")
     print()
     
-    # 按檔案大小分組
-    size_groups = defaultdict(list)
-    for file_path in files:
-        size = file_path.stat().st_size
-        size_groups[size].append(file_path)
-    
-    # 檢查相同大小的檔案
+    # 檢查相同大小的檔案（只有這些檔案才轉為 Path 物件，並記錄快取用的大小與修改時間）
     duplicate_groups = []
+    file_stats = {}
     for size, file_list in size_groups.items():
         if len(file_list) > 1:
-            duplicate_groups.append((size, file_list))
+            duplicate_groups.append((size, [Path(file_path) for file_path in file_list]))
+            file_stats.update((Path(file_path), (size, mtimes[file_path])) for file_path in file_list)
     
     print(f"發現 {len(duplicate_groups)} 組相同大小的檔案")
     print()
     
-    # 檢查內容重複
-    content_hashes = defaultdict(list)
-    total_duplicates = 0
+    hash_cache = open_hash_cache(directory)
+    try:
+        content_hashes = find_content_hashes(duplicate_groups, hash_cache, file_stats)
+        hash_cache.commit()
+    finally:
+        hash_cache.close()
     
+    # 依大小分組顯示重複情況
+    total_duplicates = 0
     for size, file_list in duplicate_groups:
         print(f"檔案大小: {size} bytes ({len(file_list)} 個檔案)")
-        
-        for file_path in file_list:
-            # 先嘗試讀取 Excel 內容
-            content_hash = get_excel_content_hash(file_path)
-            if content_hash:
-                content_hashes[content_hash].append(file_path)
-            else:
-                # 如果無法讀取 Excel，使用檔案雜湊
-                file_hash = get_file_hash(file_path)
-                if file_hash:
-                    content_hashes[file_hash].append(file_path)
-        
-        # 顯示這組中的重複情況
-        for content_hash, hash_files in content_hashes.items():
+        for content_hash, hash_files in content_hashes[size].items():
             if len(hash_files) > 1:
                 print(f"  內容雜湊 {content_hash[:8]}... 重複 {len(hash_files)} 次:")
                 for f in hash_files:
                     print(f"    - {f.name}")
                 total_duplicates += len(hash_files) - 1
-        
         print()
-        content_hashes.clear()  # 清空，準備檢查下一組
     
     print(f"總共發現 {total_duplicates} 個內容重複的檔案")
     
@@ -153,6 +276,36 @@ def check_duplicates(directory):
     print("2. 刪除帶時間戳的備份檔案")
     print("3. 檢查是否有其他內容不同的重複檔案")
 
+def find_content_hashes(duplicate_groups, hash_cache, file_stats):
+    """計算各大小分組內檔案的內容雜湊，回傳 {大小: {雜湊: [檔案]}}"""
+    # 先平行讀取所有候選檔案的 Excel 內容（解析 Excel 受 GIL 限制，使用多行程）；非 Excel 的結果也一併快取
+    candidate_files = [file_path for _, file_list in duplicate_groups for file_path in file_list]
+    with ProcessPoolExecutor(max_workers=HASH_MAX_WORKERS) as executor:
+        excel_hashes = get_cached_hashes(
+            hash_cache, "excel", candidate_files, file_stats,
+            lambda files: executor.map(get_excel_content_hash, files, chunksize=4),
+            cache_failures=True
+        )
+    
+    # 彙整所有分組的內容雜湊：{大小: {雜湊: [檔案]}}
+    content_hashes = defaultdict(lambda: defaultdict(list))
+    unreadable_files = defaultdict(list)
+    for size, file_list in duplicate_groups:
+        for file_path in file_list:
+            # 先使用 Excel 內容雜湊
+            content_hash = excel_hashes[file_path]
+            if content_hash:
+                content_hashes[size][content_hash].append(file_path)
+            else:
+                unreadable_files[size].append(file_path)
+    
+    # 無法讀取 Excel 的檔案改用檔案雜湊（取樣雜湊 → 完整雜湊），所有分組一次平行處理
+    work = [(size, file_path) for size, file_list in unreadable_files.items() if len(file_list) > 1 for file_path in file_list]
+    for size, file_hashes in group_by_file_hash(work, hash_cache, file_stats).items():
+        for file_hash, hash_files in file_hashes.items():
+            content_hashes[size][file_hash].extend(hash_files)
+    return content_hashes
+
 if __name__ == "__main__":
     backup_dir = "data_raw/etmall/backup"
     if os.path.exists(backup_dir):
@@ -25,14 +25,14 @@ def clear_logs(logs_dir="logs"):
         print(f"❌ 找不到 logs 資料夾: {full_path}")
         return
 
-    files = os.listdir(full_path)
     removed_count = 0
 
-    for file in files:
-        file_path = os.path.join(full_path, file)
-        if os.path.isfile(file_path):
-            os.remove(file_path)
-            removed_count += 1
+    # os.scandir 的目錄項目自帶檔案類型，不需逐檔 join 路徑再 stat
+    with os.scandir(full_path) as it:
+        for entry in it:
+            if entry.is_file():
+                os.unlink(entry.path)
+                removed_count += 1
 
     print(f"✅ 已刪除 {removed_count} 個檔案於 {logs_dir}/")
 
@@ -54,11 +54,13 @@
 """
 
 import os
+import re
 import shutil
-import glob
+import fnmatch
 from pathlib import Path
 from datetime import datetime
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # 路徑設定
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -68,6 +70,9 @@ LOG_DIR = PROJECT_ROOT / 'logs'
 # 確保日誌目錄存在
 os.makedirs(LOG_DIR, exist_ok=True)
 
+# 平行刪除檔案的執行緒數上限（刪除主要在等待檔案系統回應，不受 GIL 限制）
+DELETE_MAX_WORKERS = 32
+
 # 暫存檔案模式定義
 TEMP_FILE_PATTERNS = {
     'etmall': [
@@ -93,51 +98,56 @@ TEMP_FILE_PATTERNS = {
     ]
 }
 
-def get_file_size_mb(file_path):
-    """取得檔案大小（MB）"""
+# 每個平台的所有模式預先合併編譯為單一正規表示式
+TEMP_FILE_REGEX = {
+    platform_name: re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns))
+    for platform_name, patterns in TEMP_FILE_PATTERNS.items()
+}
+
+def get_file_size_mb(entry):
+    """取得檔案大小（MB），使用 os.scandir 目錄項目快取的 stat 結果"""
     try:
-        size_bytes = os.path.getsize(file_path)
-        return round(size_bytes / (1024 * 1024), 2)
-    except:
+        return round(entry.stat().st_size / (1024 * 1024), 2)
+    except OSError:
         return 0
 
-def find_temp_files(platform=None):
-    """尋找暫存檔案"""
+def scan_platform_dir(platform_name):
+    """以單次 os.scandir 掃描平台目錄，回傳符合任一暫存檔案模式的檔案（每個檔案只列出一次）"""
+    platform_dir = TEMP_DIR / platform_name
+    file_regex = TEMP_FILE_REGEX[platform_name]
     temp_files = []
-    total_size = 0
     
-    if platform and platform.lower() in TEMP_FILE_PATTERNS:
-        # 指定平台
-        patterns = TEMP_FILE_PATTERNS[platform.lower()]
-        for pattern in patterns:
-            files = glob.glob(str(TEMP_DIR / platform.lower() / pattern))
-            for file_path in files:
-                if os.path.isfile(file_path):
-                    size_mb = get_file_size_mb(file_path)
+    try:
+        with os.scandir(platform_dir) as it:
+            for entry in it:
+                # 與 glob 相同，不比對隱藏檔案
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                if file_regex.match(entry.name):
                     temp_files.append({
-                        'path': file_path,
-                        'name': Path(file_path).name,
-                        'size_mb': size_mb,
-                        'platform': platform.lower()
+                        'path': entry.path,
+                        'name': entry.name,
+                        'size_mb': get_file_size_mb(entry),
+                        'platform': platform_name
                     })
-                    total_size += size_mb
+    except FileNotFoundError:
+        pass
+    
+    return temp_files
+
+def find_temp_files(platform=None):
+    """尋找暫存檔案"""
+    if platform and platform.lower() in TEMP_FILE_PATTERNS:
+        # 指定平台
+        platform_names = [platform.lower()]
     else:
         # 所有平台
-        for platform_name, patterns in TEMP_FILE_PATTERNS.items():
-            platform_dir = TEMP_DIR / platform_name
-            if platform_dir.exists():
-                for pattern in patterns:
-                    files = glob.glob(str(platform_dir / pattern))
-                    for file_path in files:
-                        if os.path.isfile(file_path):
-                            size_mb = get_file_size_mb(file_path)
-                            temp_files.append({
-                                'path': file_path,
-                                'name': Path(file_path).name,
-                                'size_mb': size_mb,
-                                'platform': platform_name
-                            })
-                            total_size += size_mb
+        platform_names = list(TEMP_FILE_PATTERNS)
+    
+    temp_files = []
+    for platform_name in platform_names:
+        temp_files.extend(scan_platform_dir(platform_name))
+    total_size = sum(file_info['size_mb'] for file_info in temp_files)
     
     return temp_files, total_size
 
@@ -190,22 +200,22 @@ def cleanup_temp_files(temp_files, dry_run=False):
     failed_count = 0
     total_size_cleaned = 0
     
-    for i, file_info in enumerate(temp_files, 1):
-        try:
-            file_path = file_info['path']
-            file_name = file_info['name']
-            size_mb = file_info['size_mb']
-            
-            # 刪除檔案
-            os.remove(file_path)
-            success_count += 1
-            total_size_cleaned += size_mb
-            
-            print(f"  ✅ [{i:3d}/{len(temp_files)}] 已刪除：{file_name} ({size_mb:.2f} MB)")
-            
-        except Exception as e:
-            failed_count += 1
-            print(f"  ❌ [{i:3d}/{len(temp_files)}] 刪除失敗：{file_info['name']} - {e}")
+    # 以執行緒池平行刪除檔案，依完成順序回報結果
+    with ThreadPoolExecutor(max_workers=max(1, min(DELETE_MAX_WORKERS, len(temp_files)))) as executor:
+        futures = {executor.submit(os.remove, file_info['path']): file_info for file_info in temp_files}
+        
+        for i, future in enumerate(as_completed(futures), 1):
+            file_info = futures[future]
+            try:
+                future.result()
+                success_count += 1
+                total_size_cleaned += file_info['size_mb']
+                
+                print(f"  ✅ [{i:3d}/{len(temp_files)}] 已刪除：{file_info['name']} ({file_info['size_mb']:.2f} MB)")
+                
+            except Exception as e:
+                failed_count += 1
+                print(f"  ❌ [{i:3d}/{len(temp_files)}] 刪除失敗：{file_info['name']} - {e}")
     
     print(f"\n🎉 清理完成！")
     print(f"  成功：{success_count} 個檔案")
@@ -214,18 +224,23 @@ def cleanup_temp_files(temp_files, dry_run=False):
     
     return success_count, failed_count, total_size_cleaned
 
-def write_log(operation, temp_files, success_count, failed_count, total_size_cleaned):
-    """寫入操作日誌"""
+def append_log(lines):
+    """將多行日誌組合後一次附加寫入日誌檔"""
     log_file = LOG_DIR / 'clear_temp_files.log'
-    
     with open(log_file, 'a', encoding='utf-8') as f:
-        f.write(f"{datetime.now().isoformat()} - {operation}\n")
-        f.write(f"  清理檔案數：{len(temp_files)}, 成功：{success_count}, 失敗：{failed_count}\n")
-        f.write(f"  釋放空間：{total_size_cleaned:.2f} MB\n")
-        f.write(f"  清理檔案列表：\n")
-        for file_info in temp_files:
-            f.write(f"    - {file_info['name']} ({file_info['size_mb']:.2f} MB)\n")
-        f.write("-" * 50 + "\n")
+        f.write(''.join(lines))
+
+def write_log(operation, temp_files, success_count, failed_count, total_size_cleaned):
+    """寫入操作日誌"""
+    lines = [
+        f"{datetime.now().isoformat()} - {operation}\n",
+        f"  清理檔案數：{len(temp_files)}, 成功：{success_count}, 失敗：{failed_count}\n",
+        f"  釋放空間：{total_size_cleaned:.2f} MB\n",
+        f"  清理檔案列表：\n"
+    ]
+    lines.extend(f"    - {file_info['name']} ({file_info['size_mb']:.2f} MB)\n" for file_info in temp_files)
+    lines.append("-" * 50 + "\n")
+    append_log(lines)
 
 def main():
     """主要處理函數"""
@@ -274,9 +289,7 @@ def main():
     except Exception as e:
         print(f"❌ 錯誤：{e}")
         # 寫入錯誤日誌
-        log_file = LOG_DIR / 'clear_temp_files.log'
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(f"{datetime.now().isoformat()} - 錯誤：{e}\n")
+        append_log([f"{datetime.now().isoformat()} - 錯誤：{e}\n"])
 
 if __name__ == '__main__':
     main()
@@ -50,11 +50,16 @@
 """
 
 import os
+import csv
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import glob
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
 import json
+from concurrent.futures import ProcessPoolExecutor
 
 # 路徑設定
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -80,53 +85,74 @@ def find_data_files():
     
     return files
 
-def parse_order_date(date_str):
-    """解析 order_date 字串，支援多種格式"""
-    if pd.isna(date_str) or str(date_str).strip() == '':
-        return None
+# 支援的日期格式（依序嘗試）
+DATE_FORMATS = [
+    '%Y-%m-%d',
+    '%Y/%m/%d',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y/%m/%d %H:%M',
+    '%d/%m/%Y',
+    '%m/%d/%Y',
+    '%Y%m%d'
+]
+
+# 時間之後的 UTC 偏移（例如 2025-01-07T08:00:00Z、2025-01-07 08:00:00+08:00）
+UTC_OFFSET_PATTERN = r'(\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)\s*(?:Z|[+-]\d{2}:?\d{2})$'
+
+def parse_order_dates(series):
+    """向量化解析整欄 order_date，回傳只含日期部分的 Series（無法解析者為 NaT）
     
-    date_str = str(date_str).strip()
+    同一天的訂單大量重複相同的日期字串，只解析不重複的值後再對應回每一列；
+    依 DATE_FORMATS 的順序，每種格式只對尚未解析的值做一次整欄轉換。
+    """
+    series = series.astype(str).str.strip().where(series.notna())
+    values = pd.Series(series.dropna().unique(), dtype=object)
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
     
-    # 嘗試多種日期格式
-    date_formats = [
-        '%Y-%m-%d',
-        '%Y/%m/%d',
-        '%Y-%m-%d %H:%M:%S',
-        '%Y/%m/%d %H:%M:%S',
-        '%Y-%m-%d %H:%M',
-        '%Y/%m/%d %H:%M',
-        '%d/%m/%Y',
-        '%m/%d/%Y',
-        '%Y%m%d'
-    ]
+    for fmt in DATE_FORMATS:
+        mask = parsed.isna()
+        if not mask.any():
+            break
+        parsed.loc[mask] = pd.to_datetime(values[mask], format=fmt, errors='coerce')
     
-    for fmt in date_formats:
-        try:
-            parsed_date = pd.to_datetime(date_str, format=fmt)
-            # 只返回日期部分，去除時間
-            return parsed_date.normalize()
-        except:
-            continue
+    # 如果所有格式都失敗，逐筆交給 pandas 自動解析
+    mask = parsed.isna()
+    if mask.any():
+        # 去除時間後的 UTC 偏移（Z、+08:00），保留原本的當地日期，與逐筆解析時相同
+        remaining = values[mask].str.replace(UTC_OFFSET_PATTERN, r'\1', regex=True)
+        # 仍帶時區的值統一轉為 UTC 後去除時區，確保結果為無時區的 datetime
+        fallback = pd.to_datetime(remaining, format='mixed', errors='coerce', utc=True)
+        parsed.loc[mask] = fallback.dt.tz_localize(None)
     
-    # 如果所有格式都失敗，嘗試 pandas 自動解析
-    try:
-        parsed_date = pd.to_datetime(date_str)
-        # 只返回日期部分，去除時間
-        return parsed_date.normalize()
-    except:
-        return None
+    # 只保留日期部分，去除時間，再依原始字串對應回每一列
+    lookup = pd.Series(parsed.dt.normalize().values, index=values.values)
+    return series.map(lookup).astype('datetime64[ns]')
 
 def check_file_dates(file_path):
     """檢查單一檔案的日期資料"""
     print(f"\n📖 檢查檔案：{Path(file_path).name}")
     
     try:
-        # 讀取 CSV 檔案
-        df = pd.read_csv(file_path, dtype=str)
+        # 先只讀取標題列，再以 pyarrow 多執行緒解析需要的欄位（沒有 order_date 時只讀第一欄計算筆數）
+        with open(file_path, newline='', encoding='utf-8-sig') as f:
+            header = next(csv.reader(f), [])
+        has_order_date = 'order_date' in header
+        usecols = ['order_date'] if has_order_date else header[:1]
+        table = pacsv.read_csv(
+            file_path,
+            parse_options=pacsv.ParseOptions(newlines_in_values=True),
+            convert_options=pacsv.ConvertOptions(
+                include_columns=usecols,
+                column_types={column: pa.string() for column in usecols}
+            )
+        )
+        df = table.to_pandas()
         print(f"📊 總資料筆數：{len(df)}")
         
         # 檢查是否有 order_date 欄位
-        if 'order_date' not in df.columns:
+        if not has_order_date:
             print(f"❌ 檔案中沒有 order_date 欄位")
             return {
                 'file_name': Path(file_path).name,
@@ -138,21 +164,15 @@ def check_file_dates(file_path):
                 'missing_dates': []
             }
         
-        # 解析日期
-        valid_dates = []
-        invalid_count = 0
+        # 解析日期（整欄向量化解析）
+        parsed_dates = parse_order_dates(df['order_date']).dropna()
+        valid_count = len(parsed_dates)
+        invalid_count = len(df) - valid_count
         
-        for idx, row in df.iterrows():
-            date_obj = parse_order_date(row['order_date'])
-            if date_obj is not None:
-                valid_dates.append(date_obj)
-            else:
-                invalid_count += 1
-        
-        print(f"✅ 有效日期：{len(valid_dates)} 筆")
+        print(f"✅ 有效日期：{valid_count} 筆")
         print(f"❌ 無效日期：{invalid_count} 筆")
         
-        if not valid_dates:
+        if not valid_count:
             print(f"⚠️ 沒有有效的日期資料")
             return {
                 'file_name': Path(file_path).name,
@@ -165,19 +185,16 @@ def check_file_dates(file_path):
             }
         
         # 計算日期範圍
-        min_date = min(valid_dates)
-        max_date = max(valid_dates)
+        min_date = parsed_dates.min()
+        max_date = parsed_dates.max()
         date_range = (min_date, max_date)
         
         print(f"📅 日期範圍：{min_date.strftime('%Y-%m-%d')} 到 {max_date.strftime('%Y-%m-%d')}")
         
-        # 找出缺失的日期
-        missing_dates = []
-        current_date = min_date
-        while current_date <= max_date:
-            if current_date not in valid_dates:
-                missing_dates.append(current_date.strftime('%Y-%m-%d'))
-            current_date += timedelta(days=1)
+        # 找出缺失的日期（完整日期區間與實際出現日期的差集）
+        full_dates = pd.date_range(min_date, max_date, freq='D')
+        present_dates = pd.DatetimeIndex(parsed_dates.unique())
+        missing_dates = full_dates.difference(present_dates).strftime('%Y-%m-%d').tolist()
         
         print(f"🔍 缺失日期：{len(missing_dates)} 天")
         if missing_dates:
@@ -187,7 +204,7 @@ def check_file_dates(file_path):
             'file_name': Path(file_path).name,
             'total_records': len(df),
             'has_order_date': True,
-            'valid_dates': len(valid_dates),
+            'valid_dates': valid_count,
             'invalid_dates': invalid_count,
             'date_range': date_range,
             'missing_dates': missing_dates
@@ -210,40 +227,33 @@ def generate_report(results):
         if not missing_dates:
             return []
         
-        # 將字串日期轉換為 datetime 物件
-        date_objects = [datetime.strptime(date, '%Y-%m-%d') for date in missing_dates]
-        date_objects.sort()
+        # 將字串日期轉換為排序後的日期序號（天數）
+        dates = pd.to_datetime(missing_dates, format='%Y-%m-%d').unique().sort_values()
+        ordinals = dates.values.astype('datetime64[D]').astype(np.int64)
         
-        ranges = []
-        start_date = end_date = date_objects[0]
+        # 相鄰日期相差不是 1 天的位置即為區間斷點
+        breaks = np.flatnonzero(np.diff(ordinals) != 1)
+        starts = np.r_[0, breaks + 1]
+        ends = np.r_[breaks, len(ordinals) - 1]
         
-        for i in range(1, len(date_objects)):
-            current_date = date_objects[i]
-            # 如果當前日期與前一個日期連續
-            if (current_date - end_date).days == 1:
-                end_date = current_date
+        date_strings = dates.strftime('%Y-%m-%d')
+        ranges = []
+        for start, end in zip(starts, ends):
+            if start == end:
+                ranges.append(date_strings[start])
             else:
-                # 不連續，保存當前區間
-                if start_date == end_date:
-                    ranges.append(start_date.strftime('%Y-%m-%d'))
-                else:
-                    ranges.append(f"{start_date.strftime('%Y-%m-%d')}~{end_date.strftime('%Y-%m-%d')}")
-                start_date = end_date = current_date
-        
-        # 處理最後一個區間
-        if start_date == end_date:
-            ranges.append(start_date.strftime('%Y-%m-%d'))
-        else:
-            ranges.append(f"{start_date.strftime('%Y-%m-%d')}~{end_date.strftime('%Y-%m-%d')}")
+                ranges.append(f"{date_strings[start]}~{date_strings[end]}")
         
         return ranges
     
     with open(report_file, 'w', encoding='utf-8') as f:
-        f.write("=" * 80 + "\n")
-        f.write("資料日期檢查報表\n")
-        f.write("=" * 80 + "\n")
-        f.write(f"生成時間：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"檢查檔案數：{len(results)}\n\n")
+        # 先在記憶體中組合完整報表內容，最後一次寫入檔案
+        out = []
+        out.append("=" * 80 + "\n")
+        out.append("資料日期檢查報表\n")
+        out.append("=" * 80 + "\n")
+        out.append(f"生成時間：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        out.append(f"檢查檔案數：{len(results)}\n\n")
         
         # 總體統計
         total_files = len(results)
@@ -252,65 +262,65 @@ def generate_report(results):
         total_valid_dates = sum(r.get('valid_dates', 0) for r in results if 'valid_dates' in r)
         total_invalid_dates = sum(r.get('invalid_dates', 0) for r in results if 'invalid_dates' in r)
         
-        f.write("📊 總體統計\n")
-        f.write("-" * 40 + "\n")
-        f.write(f"檢查檔案數：{total_files}\n")
-        f.write(f"包含 order_date 欄位的檔案：{files_with_order_date}\n")
-        f.write(f"總資料筆數：{total_records:,}\n")
-        f.write(f"有效日期筆數：{total_valid_dates:,}\n")
-        f.write(f"無效日期筆數：{total_invalid_dates:,}\n")
-        f.write(f"日期有效率：{total_valid_dates/(total_valid_dates+total_invalid_dates)*100:.1f}%\n\n")
+        out.append("📊 總體統計\n")
+        out.append("-" * 40 + "\n")
+        out.append(f"檢查檔案數：{total_files}\n")
+        out.append(f"包含 order_date 欄位的檔案：{files_with_order_date}\n")
+        out.append(f"總資料筆數：{total_records:,}\n")
+        out.append(f"有效日期筆數：{total_valid_dates:,}\n")
+        out.append(f"無效日期筆數：{total_invalid_dates:,}\n")
+        out.append(f"日期有效率：{total_valid_dates/(total_valid_dates+total_invalid_dates)*100:.1f}%\n\n")
         
         # 各檔案詳細資訊
-        f.write("📁 各檔案詳細資訊\n")
-        f.write("=" * 80 + "\n")
+        out.append("📁 各檔案詳細資訊\n")
+        out.append("=" * 80 + "\n")
         
         for result in results:
-            f.write(f"\n檔案名稱：{result['file_name']}\n")
-            f.write("-" * 50 + "\n")
+            out.append(f"\n檔案名稱：{result['file_name']}\n")
+            out.append("-" * 50 + "\n")
             
             if 'error' in result:
-                f.write(f"❌ 錯誤：{result['error']}\n")
+                out.append(f"❌ 錯誤：{result['error']}\n")
                 continue
             
-            f.write(f"總資料筆數：{result['total_records']:,}\n")
+            out.append(f"總資料筆數：{result['total_records']:,}\n")
             
             if not result.get('has_order_date', False):
-                f.write("❌ 沒有 order_date 欄位\n")
+                out.append("❌ 沒有 order_date 欄位\n")
                 continue
             
-            f.write(f"有效日期：{result['valid_dates']:,} 筆\n")
-            f.write(f"無效日期：{result['invalid_dates']:,} 筆\n")
+            out.append(f"有效日期：{result['valid_dates']:,} 筆\n")
+            out.append(f"無效日期：{result['invalid_dates']:,} 筆\n")
             
             if result['date_range']:
                 min_date, max_date = result['date_range']
-                f.write(f"日期範圍：{min_date.strftime('%Y-%m-%d')} 到 {max_date.strftime('%Y-%m-%d')}\n")
-                f.write(f"缺失日期數：{len(result['missing_dates'])} 天\n")
+                out.append(f"日期範圍：{min_date.strftime('%Y-%m-%d')} 到 {max_date.strftime('%Y-%m-%d')}\n")
+                out.append(f"缺失日期數：{len(result['missing_dates'])} 天\n")
                 
                 if result['missing_dates']:
-                    f.write("缺失日期列表：\n")
+                    out.append("缺失日期列表：\n")
                     # 格式化為區間顯示
                     formatted_ranges = format_missing_dates(result['missing_dates'])
                     
                     if len(formatted_ranges) <= 20:
                         # 如果區間不多，全部顯示
                         for date_range in formatted_ranges:
-                            f.write(f"  - {date_range}\n")
+                            out.append(f"  - {date_range}\n")
                     else:
                         # 如果區間很多，顯示前10個和後10個
-                        f.write("  (顯示前10個和後10個)\n")
+                        out.append("  (顯示前10個和後10個)\n")
                         for date_range in formatted_ranges[:10]:
-                            f.write(f"  - {date_range}\n")
-                        f.write("  ...\n")
+                            out.append(f"  - {date_range}\n")
+                        out.append("  ...\n")
                         for date_range in formatted_ranges[-10:]:
-                            f.write(f"  - {date_range}\n")
-                        f.write(f"  (共 {len(formatted_ranges)} 個區間)\n")
+                            out.append(f"  - {date_range}\n")
+                        out.append(f"  (共 {len(formatted_ranges)} 個區間)\n")
                 else:
-                    f.write("✅ 沒有缺失日期\n")
+                    out.append("✅ 沒有缺失日期\n")
         
         # 缺失日期摘要
-        f.write("\n\n🔍 缺失日期摘要\n")
-        f.write("=" * 80 + "\n")
+        out.append("\n\n🔍 缺失日期摘要\n")
+        out.append("=" * 80 + "\n")
         
         all_missing_dates = []
         for result in results:
@@ -320,24 +330,26 @@ def generate_report(results):
         if all_missing_dates:
             # 去重並排序
             unique_missing_dates = sorted(list(set(all_missing_dates)))
-            f.write(f"總共有 {len(unique_missing_dates)} 個不同的缺失日期：\n")
+            out.append(f"總共有 {len(unique_missing_dates)} 個不同的缺失日期：\n")
             
             # 格式化為區間顯示
             formatted_ranges = format_missing_dates(unique_missing_dates)
             
             if len(formatted_ranges) <= 50:
                 for date_range in formatted_ranges:
-                    f.write(f"  - {date_range}\n")
+                    out.append(f"  - {date_range}\n")
             else:
-                f.write("  (顯示前25個和後25個)\n")
+                out.append("  (顯示前25個和後25個)\n")
                 for date_range in formatted_ranges[:25]:
-                    f.write(f"  - {date_range}\n")
-                f.write("  ...\n")
+                    out.append(f"  - {date_range}\n")
+                out.append("  ...\n")
                 for date_range in formatted_ranges[-25:]:
-                    f.write(f"  - {date_range}\n")
-                f.write(f"  (共 {len(formatted_ranges)} 個區間)\n")
+                    out.append(f"  - {date_range}\n")
+                out.append(f"  (共 {len(formatted_ranges)} 個區間)\n")
         else:
-            f.write("✅ 所有檔案都沒有缺失日期\n")
+            out.append("✅ 所有檔案都沒有缺失日期\n")
+        
+        f.write(''.join(out))
     
     print(f"📄 報表已生成：{report_file}")
     return report_file
@@ -350,11 +362,9 @@ def main():
         # 尋找檔案
         data_files = find_data_files()
         
-        # 檢查每個檔案
-        results = []
-        for file_path in data_files:
-            result = check_file_dates(file_path)
-            results.append(result)
+        # 以多行程平行檢查每個檔案（CSV 解析與日期轉換皆為 CPU 密集，結果依檔案順序回傳）
+        with ProcessPoolExecutor(max_workers=min(len(data_files), os.cpu_count() or 1)) as executor:
+            results = list(executor.map(check_file_dates, data_files))
         
         # 生成報表
         report_file = generate_report(results)
@@ -28,8 +28,12 @@ from datetime import datetime
 from pathlib import Path
 from typing import List, Tuple
 import hashlib
+import os
 import re
 
+# 第一步要轉檔的原始檔副檔名
+RAW_FILE_SUFFIXES = (".xls", ".xlsx", ".csv")
+
 def setup_logging() -> None:
     """設定日誌"""
     logging.basicConfig(
@@ -104,11 +108,12 @@ def step1_convert_all_files_to_csv(data_raw_dir: Path) -> List[Path]:
     """第一步：轉檔 - 把所有檔案都轉成 .csv，檔名加上8碼流水號"""
     logging.info("=== 第一步：轉檔 ===")
     
-    # 尋找所有檔案
-    all_files = []
-    for pattern in ["*.xls", "*.xlsx", "*.csv"]:
-        files = list(data_raw_dir.glob(pattern))
-        all_files.extend(files)
+    # 尋找所有檔案（單次 scandir 掃描，依副檔名過濾）
+    with os.scandir(data_raw_dir) as it:
+        all_files = [
+            Path(entry.path) for entry in it
+            if entry.is_file() and entry.name.lower().endswith(RAW_FILE_SUFFIXES)
+        ]
     
     if not all_files:
         logging.info("沒有找到需要處理的檔案")
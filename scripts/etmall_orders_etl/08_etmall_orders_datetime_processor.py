@@ -113,32 +113,17 @@ def process_datetime_fields(df, logger):
         if '預計入庫日' in processed_df.columns:
             logger.info("處理 '預計入庫日' 欄位...")
             
-            # 使用更靈活的日期解析方式
-            def parse_expected_inbound_date(date_str):
-                try:
-                    if pd.isna(date_str) or date_str == '':
-                        return None
-                    
-                    # 處理 "2025/7/6 上午 12:00:00" 格式
-                    if isinstance(date_str, str) and '上午' in date_str:
-                        # 提取日期部分，忽略時間
-                        date_part = date_str.split('上午')[0].strip()
-                        # 解析日期
-                        parsed_date = pd.to_datetime(date_part, format='%Y/%m/%d', errors='coerce')
-                        if pd.notna(parsed_date):
-                            return parsed_date.strftime('%Y-%m-%d')
-                    
-                    # 嘗試標準解析
-                    parsed_date = pd.to_datetime(date_str, errors='coerce')
-                    if pd.notna(parsed_date):
-                        return parsed_date.strftime('%Y-%m-%d')
-                    
-                    return None
-                except:
-                    return None
-            
-            # 應用自定義解析函數
-            processed_df['預計入庫日'] = processed_df['預計入庫日'].apply(parse_expected_inbound_date)
+            # 向量化解析："2025/7/6 上午 12:00:00" 格式只取日期部分，其餘以標準解析補上
+            inbound = processed_df['預計入庫日'].astype('string')
+            is_am = inbound.str.contains('上午', regex=False, na=False)
+            am_date = pd.to_datetime(
+                inbound.str.split('上午', n=1).str[0].str.strip().where(is_am),
+                format='%Y/%m/%d', errors='coerce'
+            )
+            parsed_date = am_date.fillna(
+                pd.to_datetime(inbound.where(am_date.isna()), format='mixed', errors='coerce')
+            )
+            processed_df['預計入庫日'] = parsed_date.dt.strftime('%Y-%m-%d')
             
             # 記錄處理結果
             non_null_count = processed_df['預計入庫日'].notna().sum()
@@ -174,13 +159,10 @@ def process_datetime_fields(df, logger):
         for col in numeric_string_columns:
             if col in processed_df.columns:
                 logger.info(f"特殊處理 '{col}' 欄位...")
-                # 先轉換為字串，然後移除小數點
-                processed_df[col] = processed_df[col].fillna('').astype(str)
-                # 將 'nan' 字串轉換為空字串
-                processed_df[col] = processed_df[col].replace('nan', '')
-                # 移除小數點，只保留整數部分
-                processed_df[col] = processed_df[col].apply(
-                    lambda x: x.split('.')[0] if x and '.' in x else x
+                # 轉為字串（空值與 'nan' 為空白）後，以向量化字串操作移除小數點，只保留整數部分
+                processed_df[col] = (
+                    processed_df[col].fillna('').astype(str).replace('nan', '')
+                    .str.split('.', n=1).str[0]
                 )
                 logger.info(f"'{col}' 已轉換為字串型態（無小數點，空值為空白）")
         
@@ -7,7 +7,8 @@
 功能：
 - 遞迴掃描 data_raw/momo 下 .xls/.xlsx/.csv（跳過 backup/）
 - 同時支援舊/新檔名格式解析
-- 轉出為新命名規則的 .csv（所有欄位以字串處理）
+- 轉出為新命名規則的 .csv（所有欄位以字串處理；多檔以行程池平行轉檔，
+  已安裝 python-calamine 時以 calamine 引擎讀取 Excel）
 - 若目標 .csv 已存在：僅保留較新的版本（以修改時間判斷）
 - 轉檔成功後將來源 .xls/.xlsx 依新命名規則重新命名搬到 backup/；
   若 backup 內同名已存在：僅保留較新的版本（以修改時間判斷）
@@ -17,6 +18,7 @@ import re
 import csv
 import logging
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from typing import Dict, Tuple, Optional
 
@@ -24,6 +26,12 @@ import pandas as pd
 import shutil
 import os
 
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"  # Rust 實作，比 openpyxl/xlrd 快一個數量級
+except ImportError:
+    EXCEL_ENGINE = None  # 交由 pandas 依副檔名選擇 openpyxl/xlrd
+
 # ===== 參數設定 =====
 INPUT_CSV_ENCODING = "utf-8-sig"
 INPUT_CSV_SEP = ","
@@ -35,6 +43,7 @@ OUTPUT_CSV_QUOTING = csv.QUOTE_ALL
 OUTPUT_CSV_LINETERMINATOR = "\n"
 
 EXCEL_SHEET_STRATEGY = "first"  # 'first' 或 'concat'
+CONVERT_MAX_WORKERS = os.cpu_count() or 1
 
 
 # ===== 日誌 =====
@@ -159,7 +168,7 @@ def read_file_as_str_df(path: Path) -> pd.DataFrame:
     suffix = path.suffix.lower()
     if suffix in ('.xls', '.xlsx'):
         if EXCEL_SHEET_STRATEGY == 'concat':
-            sheets = pd.read_excel(path, sheet_name=None, dtype=str)
+            sheets = pd.read_excel(path, sheet_name=None, dtype=str, engine=EXCEL_ENGINE)
             dfs = []
             for sheet_name, df in sheets.items():
                 df = df.astype(str).fillna("")
@@ -167,7 +176,7 @@ def read_file_as_str_df(path: Path) -> pd.DataFrame:
                 dfs.append(df)
             return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
         else:
-            return pd.read_excel(path, sheet_name=0, dtype=str).astype(str).fillna("")
+            return pd.read_excel(path, sheet_name=0, dtype=str, engine=EXCEL_ENGINE).astype(str).fillna("")
     elif suffix == '.csv':
         return pd.read_csv(
             path, dtype=str, sep=INPUT_CSV_SEP,
@@ -201,6 +210,16 @@ def write_df_to_csv_all_str(df: pd.DataFrame, out_path: Path) -> None:
     )
 
 
+def convert_file(src_path: Path, out_csv: Path) -> Optional[str]:
+    """單檔轉出 CSV（供行程池呼叫）；成功回傳 None，失敗回傳錯誤訊息"""
+    try:
+        df = read_file_as_str_df(src_path)
+        write_df_to_csv_all_str(df, out_csv)
+        return None
+    except Exception as e:
+        return str(e)
+
+
 # ===== 比較並保留較新版本 =====
 def keep_newer_when_conflict(src: Path, dst: Path) -> str:
     """
@@ -250,9 +269,11 @@ def process_files(momo_dir: Path, module_info: Dict[str, Dict[str, str]]) -> Non
     logging.info(f"找到 {len(targets)} 個待處理檔案")
     converted_count = skipped_count = moved_count = replaced_csv = kept_csv = replaced_backup = kept_backup = 0
 
+    # 第一輪：解析檔名並決定每個檔案的處理方式
+    plans = []
+    planned_outputs = set()
     for src_path in targets:
         stem, ext = src_path.stem, src_path.suffix.lower()
-        logging.info(f"處理檔案: {src_path.name}")
 
         # 已為新命名且為 CSV → 直接跳過
         if ext == '.csv' and is_already_renamed(stem, module_info):
@@ -269,40 +290,49 @@ def process_files(momo_dir: Path, module_info: Dict[str, Dict[str, str]]) -> Non
         module_code, delivery_code, customer_code, date_str, time_str = parsed
         new_stem = generate_new_stem(module_code, delivery_code, customer_code, date_str, time_str, module_info)
 
-        # 1) 產出 CSV（保留較新版本）
+        # 產出 CSV（保留較新版本）：比較來源與現有 CSV 的 mtime；
+        # 同一輪已有來源會寫出同名 CSV 時，視同目標較新，避免平行寫入同一檔案
         out_csv = src_path.parent / f"{new_stem}.csv"
-        if out_csv.exists():
-            # 比較來源與現有 CSV 的 mtime
+        if out_csv in planned_outputs:
+            decision = 'kept_dst'
+        elif out_csv.exists():
             decision = keep_newer_when_conflict(src_path, out_csv)
-            if decision == 'kept_dst':
-                logging.info(f"目標 CSV 較新，保留現有：{out_csv.name}；來源略過：{src_path.name}")
-                kept_csv += 1
-            else:
-                # 'replaced' or 'moved'（視為需要重寫）
-                try:
-                    df = read_file_as_str_df(src_path)
-                    write_df_to_csv_all_str(df, out_csv)  # 覆寫或寫入
-                    if decision == 'replaced':
-                        logging.info(f"🔁 覆寫較舊 CSV：{out_csv.name}")
-                        replaced_csv += 1
-                    else:
-                        logging.info(f"✅ 轉檔成功：{src_path.name} -> {out_csv.name}")
-                        converted_count += 1
-                except Exception as e:
-                    logging.error(f"❌ 轉檔失敗: {src_path.name} - {e}")
-                    skipped_count += 1
-                    continue
         else:
-            # 不存在 → 直接寫出
-            try:
-                df = read_file_as_str_df(src_path)
-                write_df_to_csv_all_str(df, out_csv)
-                logging.info(f"✅ 轉檔成功：{src_path.name} -> {out_csv.name}")
-                converted_count += 1
-            except Exception as e:
-                logging.error(f"❌ 轉檔失敗: {src_path.name} - {e}")
+            decision = 'moved'
+        planned_outputs.add(out_csv)
+        plans.append((src_path, ext, new_stem, out_csv, decision))
+
+    # 第二輪：需轉檔者以行程池平行轉出 CSV（各檔案互相獨立）
+    convert_jobs = [(src_path, out_csv) for src_path, _, _, out_csv, decision in plans if decision != 'kept_dst']
+    convert_errors: Dict[Path, Optional[str]] = {}
+    if convert_jobs:
+        max_workers = min(CONVERT_MAX_WORKERS, len(convert_jobs))
+        logging.info(f"開始轉檔：{len(convert_jobs)} 個檔案，{max_workers} 個行程（Excel 引擎：{EXCEL_ENGINE or 'pandas 預設'}）")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            sources = [src for src, _ in convert_jobs]
+            outputs = [out for _, out in convert_jobs]
+            convert_errors = dict(zip(sources, executor.map(convert_file, sources, outputs)))
+
+    # 第三輪：依序記錄轉檔結果並搬移 Excel 至 backup
+    for src_path, ext, new_stem, out_csv, decision in plans:
+        logging.info(f"處理檔案: {src_path.name}")
+
+        # 1) 轉檔結果
+        if decision == 'kept_dst':
+            logging.info(f"目標 CSV 較新，保留現有：{out_csv.name}；來源略過：{src_path.name}")
+            kept_csv += 1
+        else:
+            error = convert_errors.get(src_path)
+            if error is not None:
+                logging.error(f"❌ 轉檔失敗: {src_path.name} - {error}")
                 skipped_count += 1
                 continue
+            if decision == 'replaced':
+                logging.info(f"🔁 覆寫較舊 CSV：{out_csv.name}")
+                replaced_csv += 1
+            else:
+                logging.info(f"✅ 轉檔成功：{src_path.name} -> {out_csv.name}")
+                converted_count += 1
 
         # 2) Excel 搬到 backup（保留較新版本）
         if ext in ('.xls', '.xlsx'):
@@ -47,10 +47,12 @@ def format_for_bigquery():
     
     for col in string_columns:
         if col in df.columns:
-            # 清理字串：去除多餘空白、換行符號
-            df[col] = df[col].astype(str).str.strip().str.replace('\n', ' ').str.replace('\r', ' ')
-            # 空值統一為空字串
-            df[col] = df[col].replace(['nan', 'None', 'null'], '')
+            # 清理字串：去除多餘空白、換行符號，空值統一為空字串（單次欄位重寫）
+            df[col] = (
+                df[col].astype(str).str.strip()
+                .str.replace(r'[\r\n]', ' ', regex=True)
+                .replace(['nan', 'None', 'null'], '')
+            )
     
     # 2. 整數欄位轉換
     integer_columns = [
@@ -58,10 +60,6 @@ def format_for_bigquery():
         'min_qty'
     ]
     
-    for col in integer_columns:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype('Int64')
-    
     # 3. 浮點數欄位轉換
     float_columns = [
         'weight_total_kg', 'weight_max_kg', 'price_unit', 'price_total',
@@ -69,9 +67,12 @@ def format_for_bigquery():
         'weight_g', 'msrp', 'supplier_price', 'list_price', 'cost'
     ]
     
-    for col in float_columns:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0)
+    # 整數與浮點數欄位一次轉換，再以單一 astype 設定整數型別
+    integer_columns = [col for col in integer_columns if col in df.columns]
+    numeric_columns = integer_columns + [col for col in float_columns if col in df.columns]
+    if numeric_columns:
+        df[numeric_columns] = df[numeric_columns].apply(pd.to_numeric, errors='coerce').fillna(0)
+        df = df.astype(dict.fromkeys(integer_columns, 'Int64'))
     
     # 4. 布林欄位轉換
     boolean_columns = ['confirm', 'is_merge_box']
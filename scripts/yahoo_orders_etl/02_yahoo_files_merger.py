@@ -302,8 +302,8 @@ def standardize_columns(df: pd.DataFrame, file_type: str) -> pd.DataFrame:
         logging.info(f"開始標準化欄位，順序：{ordered_fields}")
         logging.info(f"原始 DataFrame 欄位：{list(df.columns)}")
         
-        # 創建標準化的 DataFrame
-        standardized_df = pd.DataFrame()
+        # 創建標準化的 DataFrame（沿用原始索引，純量欄位可直接廣播）
+        standardized_df = pd.DataFrame(index=df.index)
         
         # 第一階段：處理基本欄位（platform, order_date 等）
         for field_name in ordered_fields:
@@ -391,8 +391,8 @@ def standardize_columns(df: pd.DataFrame, file_type: str) -> pd.DataFrame:
                         logging.warning(f"必要欄位沒有有效資料，line_number 填入空值")
                         standardized_df[field_name] = [''] * len(df)
         
-        # 添加處理日期欄位
-        standardized_df['processing_date'] = [datetime.now()] * len(df)
+        # 添加處理日期欄位（單一時間戳廣播為 datetime64 欄位，不建立逐列物件清單）
+        standardized_df['processing_date'] = pd.Timestamp.now()
         
         logging.info(f"標準化完成，共 {len(standardized_df.columns)} 個欄位，{len(standardized_df)} 行資料")
         logging.info(f"最終欄位：{list(standardized_df.columns)}")
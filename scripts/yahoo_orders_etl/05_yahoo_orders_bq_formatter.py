@@ -168,8 +168,8 @@ def convert_data_types(df: pd.DataFrame) -> pd.DataFrame:
             if column in converted_df.columns:
                 try:
                     if bq_type == 'STRING':
-                        # 轉換為字串，空值保持為空字串，確保數值如 "00" 正確顯示
-                        converted_df[column] = converted_df[column].fillna('').astype(str).replace('nan', '').replace('None', '')
+                        # 轉換為 pyarrow 字串型別，空值保持為 <NA>（輸出 CSV 時為空白），確保數值如 "00" 正確顯示
+                        converted_df[column] = converted_df[column].astype('string[pyarrow]').replace(['nan', 'None'], pd.NA)
                     
                     elif bq_type == 'FLOAT64':
                         # 轉換為浮點數，無法轉換的設為 0.0